@@ -0,0 +1,17 @@
+; tight register-only arithmetic loops
+.orig x3000
+        LD R4, OUTER
+OLOOP   LD R2, INNER
+        AND R3, R3, #0
+ILOOP   ADD R3, R3, R2
+        AND R5, R3, #7
+        ADD R5, R5, R3
+        NOT R5, R5
+        ADD R2, R2, #-1
+        BRp ILOOP
+        ADD R4, R4, #-1
+        BRp OLOOP
+        HALT
+OUTER   .fill 100
+INNER   .fill 1000
+.end
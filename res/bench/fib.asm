@@ -0,0 +1,31 @@
+; naive recursive fibonacci through JSR with a stack in R6
+.orig x3000
+        LD R6, STACK
+        LD R0, ARG
+        JSR FIB
+        ST R0, RESULT
+        HALT
+
+; R0 = fib(R0); R1 and R2 are preserved
+FIB     ADD R6, R6, #-3
+        STR R7, R6, #0
+        STR R1, R6, #1
+        STR R2, R6, #2
+        ADD R1, R0, #-2
+        BRn FIB_RET
+        ADD R2, R0, #0
+        ADD R0, R2, #-1
+        JSR FIB
+        ADD R1, R0, #0
+        ADD R0, R2, #-2
+        JSR FIB
+        ADD R0, R0, R1
+FIB_RET LDR R7, R6, #0
+        LDR R1, R6, #1
+        LDR R2, R6, #2
+        ADD R6, R6, #3
+        RET
+ARG     .fill 20
+STACK   .fill xFD00
+RESULT  .fill 0
+.end
@@ -0,0 +1,41 @@
+.orig x22
+.fill __BENCH_PUTS__
+.end
+
+.orig x25
+.fill __BENCH_HALT__
+.end
+
+.orig x200
+__BENCH_PUTS__
+ST R0, __BENCH_PUTS_R0__
+ST R1, __BENCH_PUTS_R1__
+ST R2, __BENCH_PUTS_R2__
+__BENCH_PUTS_LOOP__
+LDR R2, R0, 0
+BRz __BENCH_PUTS_END__
+__BENCH_PUTS_WAIT__
+LDI R1, __BENCH_DSR__
+BRzp __BENCH_PUTS_WAIT__
+STI R2, __BENCH_DDR__
+ADD R0, R0, 1
+BR __BENCH_PUTS_LOOP__
+__BENCH_PUTS_END__
+LD R0, __BENCH_PUTS_R0__
+LD R1, __BENCH_PUTS_R1__
+LD R2, __BENCH_PUTS_R2__
+RET
+__BENCH_DSR__ .fill xFE04
+__BENCH_DDR__ .fill xFE06
+__BENCH_PUTS_R0__ .fill 0
+__BENCH_PUTS_R1__ .fill 0
+__BENCH_PUTS_R2__ .fill 0
+.end
+
+.orig x300
+__BENCH_HALT__
+LD R0, __BENCH_MCR__
+AND R1, R1, 0
+STR R1, R0, 0
+__BENCH_MCR__ .fill xFFFE
+.end
@@ -0,0 +1,11 @@
+; output bound: PUTS through the polling trap routine
+.orig x3000
+        LD R1, COUNT
+LOOP    LEA R0, MESSAGE
+        PUTS
+        ADD R1, R1, #-1
+        BRp LOOP
+        HALT
+COUNT   .fill 2000
+MESSAGE .stringz "The quick brown fox jumps over the lazy dog\n"
+.end
@@ -0,0 +1,40 @@
+; bubble sort of pseudo-random words held in memory
+.orig x3000
+        LEA R0, ARRAY
+        LD R1, N
+        LD R2, SEED
+        LD R4, MASK
+FILL    ADD R3, R2, R2
+        ADD R3, R3, R3
+        ADD R2, R3, R2
+        ADD R2, R2, #13
+        AND R3, R2, R4
+        STR R3, R0, #0
+        ADD R0, R0, #1
+        ADD R1, R1, #-1
+        BRp FILL
+
+        LD R1, N
+        ADD R1, R1, #-1
+OUTER   BRnz DONE
+        LEA R0, ARRAY
+        ADD R2, R1, #0
+INNER   LDR R3, R0, #0
+        LDR R4, R0, #1
+        NOT R5, R4
+        ADD R5, R5, #1
+        ADD R5, R3, R5
+        BRnz NOSWAP
+        STR R4, R0, #0
+        STR R3, R0, #1
+NOSWAP  ADD R0, R0, #1
+        ADD R2, R2, #-1
+        BRp INNER
+        ADD R1, R1, #-1
+        BR OUTER
+DONE    HALT
+N       .fill 300
+SEED    .fill 1
+MASK    .fill x3FFF
+ARRAY   .blkw 300
+.end
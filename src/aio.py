@@ -0,0 +1,115 @@
+import asyncio
+import sys
+from time import monotonic
+
+from lc3 import LC3, ExecutionResult
+
+
+class QueueStream:
+    def __init__(self, queue):
+        self.queue = queue
+
+    def write(self, text):
+        self.queue.put_nowait(text)
+
+    def flush(self):
+        pass
+
+
+class AsyncLC3:
+    slice_size = 4096
+
+    def __init__(self, machine=None, slice_size=None):
+        self.machine = machine or LC3(interactive=False)
+        self.machine.interactive = False
+        self.machine.blocking_input = False
+        self.slice_size = slice_size or AsyncLC3.slice_size
+        self.input = asyncio.Queue()
+        self.output = asyncio.Queue()
+        self.machine.display.stream = QueueStream(self.output)
+        self.closed = False
+
+    def load(self, memory, origin=0x3000, native_traps=False):
+        self.machine.load(memory, origin, native_traps)
+
+    def load_file(self, filename, origin=0x3000, native_traps=False):
+        self.load(self.machine.assembler.assemble_file(filename), origin,
+                  native_traps)
+
+    async def send(self, data):
+        await self.input.put(data)
+
+    async def close_input(self):
+        await self.input.put(None)
+
+    def feed(self, data):
+        if data is None:
+            self.closed = True
+        else:
+            self.machine.keyboard.feed(data)
+
+    def drain(self):
+        while not self.input.empty():
+            self.feed(self.input.get_nowait())
+
+    async def wait_for_input(self, deadline):
+        if self.closed:
+            return False
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - monotonic()
+            if timeout <= 0:
+                return False
+        try:
+            data = await asyncio.wait_for(self.input.get(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.feed(data)
+        return not self.closed
+
+    async def run(self, engine='interpreter', max_instructions=None,
+                  timeout=None):
+        # the machine runs in slices of slice_size instructions, giving the
+        # event loop a turn between slices; a slice that ends with the
+        # program polling an empty keyboard parks the session until input
+        # arrives instead of spinning
+        machine = self.machine
+        limit = sys.maxsize if max_instructions is None else max_instructions
+        deadline = None if timeout is None else monotonic() + timeout
+        total = 0
+        try:
+            while True:
+                self.drain()
+                machine.polled = False
+                result = machine.run(engine,
+                                     min(self.slice_size, limit - total),
+                                     deadline)
+                total += result.instructions
+                machine.display.flush()
+                status = result.status
+                waiting = status == ExecutionResult.waiting or \
+                    status == ExecutionResult.budget and machine.polled and \
+                    not machine.keyboard.ready()
+                if status == ExecutionResult.budget and total >= limit:
+                    return ExecutionResult(status, total, result.pc)
+                if waiting:
+                    if not await self.wait_for_input(deadline):
+                        status = ExecutionResult.waiting if self.closed \
+                            else ExecutionResult.timeout
+                        return ExecutionResult(status, total, machine.pc)
+                elif status == ExecutionResult.budget:
+                    await asyncio.sleep(0)
+                else:
+                    return ExecutionResult(status, total, result.pc)
+        finally:
+            machine.display.flush()
+            self.output.put_nowait(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        text = await self.output.get()
+        if text is None:
+            raise StopAsyncIteration
+        return text
@@ -1,265 +1,351 @@
-class Assembler:
+import codecs
+import re
+from array import array
+from collections import deque
+from itertools import islice
+
+from objfile import write_object, write_records
+
+REG = 'REG'
+REG_OR_IMM5 = 'REG_OR_IMM5'
+IMM = 'IMM'
+VECT = 'VECT'
+PC = 'PC'
+
+token_pattern = re.compile(r'"(?:[^"\\]|\\.)*"|;|[^\s,;"]+')
+number_pattern = re.compile(r'^(?:#?([+-]?\d+)|[xX]([+-]?[0-9a-fA-F]+))$')
+registers = {prefix + str(i): i for prefix in 'rR' for i in range(8)}
+
+
+class AssemblerException(Exception):
+    pass
+
+
+def tokenize(line):
+    if '"' not in line:
+        return line.split(';', 1)[0].replace(',', ' ').split()
+    tokens = token_pattern.findall(line)
+    if ';' in tokens:
+        tokens = tokens[:tokens.index(';')]
+    return tokens
+
+
+def parse_number(token):
+    match = number_pattern.match(token)
+    if match is None:
+        return None
+    if match.group(1) is not None:
+        return int(match.group(1))
+    return int(match.group(2), 16)
+
+
+def parse_register(token):
+    return registers.get(token)
+
+
+class PendingWords(dict):
+    # sparse stand-in for memory that remembers the order in which
+    # addresses were first written
     def __init__(self):
-        self.orig = None
+        dict.__init__(self)
+        self.order = deque()
+
+    def __setitem__(self, address, word):
+        if address not in self:
+            self.order.append(address)
+        dict.__setitem__(self, address, word)
 
-        self.instrs = {
-            'add': self.assemble_add,
-            'and': self.assemble_and,
-            'br': self.assemble_br,
-            'brn': self.assemble_br,
-            'brz': self.assemble_br,
-            'brp': self.assemble_br,
-            'brnz': self.assemble_br,
-            'brzp': self.assemble_br,
-            'brnp': self.assemble_br,
-            'brnzp': self.assemble_br,
-            'jmp': self.assemble_jmp,
-            'jsr': self.assemble_jsr,
-            'jsrr': self.assemble_jsrr,
-            'ld': self.assemble_ld,
-            'ldi': self.assemble_ldi,
-            'ldr': self.assemble_ldr,
-            'lea': self.assemble_lea,
-            'not': self.assemble_not,
-            'ret': self.assemble_jmp,
-            'rti': self.assemble_rti,
-            'st': self.assemble_st,
-            'sti': self.assemble_sti,
-            'str': self.assemble_str,
-            'trap': self.assemble_trap
-        }
 
+class Assembler:
+    # mnemonic -> (base word, operand grammar); each operand is a
+    # (kind, shift or width) pair consumed left to right
+    grammars = {
+        'add': (0x1000, ((REG, 9), (REG, 6), (REG_OR_IMM5, 0))),
+        'and': (0x5000, ((REG, 9), (REG, 6), (REG_OR_IMM5, 0))),
+        'br': (0x0E00, ((PC, 9),)),
+        'brn': (0x0800, ((PC, 9),)),
+        'brz': (0x0400, ((PC, 9),)),
+        'brp': (0x0200, ((PC, 9),)),
+        'brnz': (0x0C00, ((PC, 9),)),
+        'brzp': (0x0600, ((PC, 9),)),
+        'brnp': (0x0A00, ((PC, 9),)),
+        'brnzp': (0x0E00, ((PC, 9),)),
+        'jmp': (0xC000, ((REG, 6),)),
+        'jsr': (0x4800, ((PC, 11),)),
+        'jsrr': (0x4000, ((REG, 6),)),
+        'ld': (0x2000, ((REG, 9), (PC, 9))),
+        'ldi': (0xA000, ((REG, 9), (PC, 9))),
+        'ldr': (0x6000, ((REG, 9), (REG, 6), (IMM, 6))),
+        'lea': (0xE000, ((REG, 9), (PC, 9))),
+        'not': (0x903F, ((REG, 9), (REG, 6))),
+        'ret': (0xC1C0, ()),
+        'rti': (0x8000, ()),
+        'st': (0x3000, ((REG, 9), (PC, 9))),
+        'sti': (0xB000, ((REG, 9), (PC, 9))),
+        'str': (0x7000, ((REG, 9), (REG, 6), (IMM, 6))),
+        'trap': (0xF000, ((VECT, 8),)),
+        'getc': (0xF020, ()),
+        'out': (0xF021, ()),
+        'puts': (0xF022, ()),
+        'in': (0xF023, ()),
+        'putsp': (0xF024, ()),
+        'halt': (0xF025, ())
+    }
+
+    def __init__(self):
+        self.orig = None
+        self.segment_start = None
+        self.segments = []
+        self.labels = {}
+        self.fixups = []
+        self.exports = []
+        self.relocations = []
+        self.line_number = 0
         self.ops = {
             '.orig': self.process_orig,
             '.end': self.process_end,
             '.fill': self.process_fill,
             '.blkw': self.process_blkw,
-            '.stringz': self.process_stringz
+            '.stringz': self.process_stringz,
+            '.export': self.process_export
         }
 
-        self.traps = {
-            'getc': 'trap x20',
-            'out': 'trap x21',
-            'puts': 'trap x22',
-            'in': 'trap x23',
-            'putsp': 'trap x24',
-            'halt': 'trap x25'
-        }
-
-        self.labels = {}
-
     def assemble_file(self, filename):
         with open(filename, 'r') as f:
-            return self.assemble([line for line in f])
+            return self.assemble(f)
 
     def assemble(self, lines):
-        memory = [0] * (1 << 16)
-        i = 0
-        to_be_assembled = []
-        self.orig = 0
-
-        for i, line in enumerate(lines):
-            line = line.split(';')[0].split()
-            for j, tok in enumerate(line):
-                ltok = tok.lower()
-                if ltok in self.instrs or ltok in self.traps or ltok == '.fill':
-                    to_be_assembled.append(' '.join(line[j:]))
-                    self.orig += 1
-                    break
-                elif ltok in self.ops:
-                    to_be_assembled.append(' '.join(line[j:]))
-                    self.ops[ltok](' '.join(line[j:]), memory)
-                    break
-                else:
-                    if tok in self.labels:
-                        message = 'Duplicate Symbol Found on line ' + str(i) + \
-                                  ': ' + tok + ' already defined'
-                        raise Exception(message)
-                    self.labels[tok] = self.orig
-
-        self.orig = 0
-        for i, line in enumerate(to_be_assembled):
-            line = line.split(';')[0].split()
-            for j, tok in enumerate(line):
-                ltok = tok.lower()
-                if ltok in self.instrs:
-                    memory[self.orig] = self.instrs[ltok](' '.join(line[j:]))
-                    self.orig += 1
-                    break
-                elif ltok in self.ops:
-                    self.ops[ltok](' '.join(line[j:]), memory)
-                    break
-                elif ltok in self.traps:
-                    memory[self.orig] = self.instrs['trap'](self.traps[ltok])
-                    self.orig += 1
-                    break
-                else:
-                    assert tok in self.labels
-        
+        memory = array('H', [0]) * (1 << 16)
+        self.reset()
+        self.assemble_lines(lines, memory)
+        self.backpatch(memory)
         return memory
 
-    def process_orig(self, line, memory):
-        digits = self.get_digits(line, '.orig NUM')
-        self.orig = digits[0]
+    def assemble_records(self, lines):
+        # resets before returning, so labels and segments can be handed on
+        # while the records are still being produced
+        self.reset()
+        return self.records(lines)
+
+    def records(self, lines):
+        # yields (address, word) in program order as soon as a word is
+        # final; a word waiting on a forward reference holds back the ones
+        # after it, so only the stretch up to the label is kept in memory
+        words = PendingWords()
+        held = set()
+        waiting = {}
+        for self.line_number, line in enumerate(lines):
+            defined = len(self.labels)
+            self.assemble_line(tokenize(line), words)
+            self.relocations = []
+            for fixup in self.fixups:
+                waiting.setdefault(fixup[1], []).append(fixup)
+                held.add(fixup[0])
+            self.fixups = []
+            if len(self.labels) > defined and waiting:
+                for label in islice(reversed(self.labels),
+                                    len(self.labels) - defined):
+                    self.fixups.extend(waiting.pop(label, ()))
+                line_number = self.line_number
+                self.backpatch(words)
+                self.line_number = line_number
+                held.difference_update(origin for origin, _, _, _ in
+                                       self.fixups)
+                self.fixups = []
+            while words.order and words.order[0] not in held:
+                address = words.order.popleft()
+                yield address, words.pop(address)
+        if self.segment_start is not None:
+            self.process_end((), words)
+        for fixups in waiting.values():
+            self.fixups.extend(fixups)
+        self.backpatch(words)
+        for address in words.order:
+            yield address, words[address]
+
+    def reset(self):
+        self.orig = None
+        self.segment_start = None
+        self.segments = []
+        self.labels = {}
+        self.fixups = []
+        self.exports = []
+        self.relocations = []
+
+    def assemble_lines(self, lines, memory, first_line=0):
+        for self.line_number, line in enumerate(lines, first_line):
+            self.assemble_line(tokenize(line), memory)
+        if self.segment_start is not None:
+            self.process_end((), memory)
+
+    def assemble_line(self, tokens, memory):
+        for j, tok in enumerate(tokens):
+            ltok = tok.lower()
+            grammar = Assembler.grammars.get(ltok)
+            if grammar is not None:
+                self.put(memory, self.encode(grammar, tokens[j + 1:]))
+                return
+            op = self.ops.get(ltok)
+            if op is not None:
+                op(tokens[j + 1:], memory)
+                return
+            self.define_label(tok)
+
+    def define_label(self, label):
+        if label in self.labels:
+            self.error('Duplicate Symbol Found: {} already defined'.format(
+                label))
+        self.check_address()
+        self.labels[label] = self.orig
+
+    def encode(self, grammar, operands):
+        word, kinds = grammar
+        if len(operands) != len(kinds):
+            self.error('Expected {} operands, found {}'.format(
+                len(kinds), len(operands)))
+        for (kind, arg), token in zip(kinds, operands):
+            if kind == REG:
+                word |= self.register(token) << arg
+            elif kind == REG_OR_IMM5:
+                register = parse_register(token)
+                if register is not None:
+                    word |= register
+                else:
+                    word |= 0x20 | self.signed(token, 5)
+            elif kind == IMM:
+                word |= self.signed(token, arg)
+            elif kind == VECT:
+                word |= self.unsigned(token, arg)
+            else:
+                word |= self.pc_offset(token, arg)
+        return word
+
+    def register(self, token):
+        register = parse_register(token)
+        if register is None:
+            self.error('Expected a register, found ' + token)
+        return register
+
+    def number(self, token):
+        value = parse_number(token)
+        if value is None:
+            self.error('Expected a number, found ' + token)
+        return value
+
+    def signed(self, token, bits):
+        value = self.number(token)
+        if not -(1 << (bits - 1)) <= value < 1 << (bits - 1):
+            self.error('{} does not fit in {} signed bits'.format(token, bits))
+        return value & ~(~0 << bits)
+
+    def unsigned(self, token, bits):
+        value = self.number(token)
+        if not 0 <= value < 1 << bits:
+            self.error('{} does not fit in {} bits'.format(token, bits))
+        return value
+
+    def pc_offset(self, label, bits):
+        # every symbolic reference is kept as a relocation so the linker can
+        # patch it again once modules are placed
+        self.relocations.append((self.orig, label, bits))
+        address = self.labels.get(label)
+        if address is None:
+            self.fixups.append((self.orig, label, bits, self.line_number))
+            return 0
+        return self.offset(address, self.orig, label, bits)
+
+    def offset(self, address, origin, label, bits):
+        offset = address - (origin + 1)
+        if not -(1 << (bits - 1)) <= offset < 1 << (bits - 1):
+            self.error('Label {} is out of range of a {} bit offset'.format(
+                label, bits))
+        return offset & ~(~0 << bits)
+
+    def backpatch(self, memory, strict=True):
+        unresolved = []
+        for fixup in self.fixups:
+            origin, label, bits, self.line_number = fixup
+            address = self.labels.get(label)
+            if address is None:
+                if strict:
+                    self.error('Undefined label ' + label)
+                unresolved.append(fixup)
+            elif bits == 16:
+                memory[origin] = address
+            else:
+                memory[origin] |= self.offset(address, origin, label, bits)
+        self.fixups = unresolved
+
+    def check_address(self):
+        if self.orig is None:
+            self.error('Code outside of a .orig/.end segment')
+        if self.orig > 0xFFFF:
+            self.error('Segment runs past the end of memory')
+
+    def put(self, memory, word):
+        self.check_address()
+        memory[self.orig] = word
+        self.orig += 1
 
-    def process_blkw(self, line, memory):
-        digits = self.get_digits(line, '.blkw NUM')
-        self.orig += digits[0]
+    def error(self, message):
+        raise AssemblerException('Line {}: {}'.format(
+            self.line_number + 1, message))
 
-    def process_end(self, line, memory):
-        self.orig = None
+    def write_object(self, memory, filename):
+        write_object(filename, memory, self.segments, self.labels)
 
-    def process_stringz(self, line, memory):
-        text = line.split('.stringz')[1].strip()
-        text = bytes(text, 'utf-8').decode('unicode_escape')
-        assert (text[0] == '"' and text[-1] == '"')
-        text = text[1:-1]
-        for char in text:
-            memory[self.orig] = ord(char)
-            self.orig += 1
-        memory[self.orig] = 0
-        self.orig += 1
+    def write_records(self, lines, filename):
+        records = self.assemble_records(lines)
+        write_records(filename, records, self.labels)
 
-    def process_fill(self, line, memory):
-        try:
-            digits = self.get_digits(line, '.fill NUM')
-            memory[self.orig] = digits[0]
-        except Exception:
-            digits = self.get_digits(line, '.fill ID')
-            memory[self.orig] = self.labels[digits[0]]
-        self.orig += 1
+    def process_orig(self, operands, memory):
+        self.orig = self.unsigned(self.single(operands), 16)
+        self.segment_start = self.orig
+
+    def process_blkw(self, operands, memory):
+        self.check_address()
+        self.orig += self.unsigned(self.single(operands), 16)
+
+    def process_end(self, operands, memory):
+        if self.segment_start is not None:
+            self.segments.append((self.segment_start, self.orig))
+        self.segment_start = None
+        self.orig = None
+
+    def process_stringz(self, operands, memory):
+        text = self.single(operands)
+        if len(text) < 2 or text[0] != '"' or text[-1] != '"':
+            self.error('Expected a quoted string, found ' + text)
+        for char in codecs.decode(text[1:-1], 'unicode_escape'):
+            self.put(memory, ord(char) & 0xFFFF)
+        self.put(memory, 0)
+
+    def process_fill(self, operands, memory):
+        token = self.single(operands)
+        value = parse_number(token)
+        if value is not None:
+            if not -(1 << 15) <= value < 1 << 16:
+                self.error('{} does not fit in 16 bits'.format(token))
+            self.put(memory, value & 0xFFFF)
+        elif token in self.labels:
+            self.relocations.append((self.orig, token, 16))
+            self.put(memory, self.labels[token])
+        else:
+            self.relocations.append((self.orig, token, 16))
+            self.fixups.append((self.orig, token, 16, self.line_number))
+            self.put(memory, 0)
+
+    def process_export(self, operands, memory):
+        self.exports.append(self.single(operands))
+
+    def single(self, operands):
+        if len(operands) != 1:
+            self.error('Expected 1 operand, found {}'.format(len(operands)))
+        return operands[0]
 
-    @staticmethod
-    def assert_max_digit_lengths(digits, lengths):
-        for i, cur in enumerate(digits):
-            if cur < 0:
-                cur = -cur
-            if ~(~0x0 << lengths[i]) & cur != cur:
-                raise Exception('FuckedUpDigitLengthException')
-
-    def assemble_add(self, line):
-        try:
-            digits = self.get_digits(line, 'add REG, REG, REG')
-            self.assert_max_digit_lengths(digits, [3, 3, 3])
-            result = 0x1000 | digits[0] << 9 | digits[1] << 6 | digits[2]
-        except Exception:
-            digits = self.get_digits(line, 'add REG, REG, NUM')
-            self.assert_max_digit_lengths(digits, [3, 3, 5])
-            result = 0x1000 | digits[0] << 9 | digits[1] << 6 | 1 << 5 | digits[2] & 0x1F
-        return result
-
-    def assemble_and(self, line):
-        try:
-            digits = self.get_digits(line, 'and REG, REG, REG')
-            self.assert_max_digit_lengths(digits, [3, 3, 3])
-            result = 0x5000 | digits[0] << 9 | digits[1] << 6 | digits[2]
-        except Exception:
-            digits = self.get_digits(line, 'and REG, REG, NUM')
-            self.assert_max_digit_lengths(digits, [3, 3, 5])
-            result = 0x5000 | digits[0] << 9 | digits[1] << 6 | 1 << 5 | digits[2] & 0x1F
-        return result
-
-    def assemble_br(self, line):
-        br, label = line.strip().split(' ')
-        extensions = {'': 0b111, 'n': 0b100, 'z': 0b010, 'p': 0b001,
-                      'nz': 0b110, 'np': 0b101, 'zp': 0b011, 'nzp': 0b111}
-        offset = self.labels[label] - (self.orig + 1)
-        self.assert_max_digit_lengths([offset], [9])
-        return 0x0000 | extensions[br[2:]] << 9 | offset & 0x1FF
-
-    def assemble_jmp(self, line):
-        if line.lower() == 'ret':
-            return 0xC000 | 0b111 << 6
-        digits = self.get_digits(line, 'jmp REG')
-        self.assert_max_digit_lengths(digits, [3])
-        return 0xC000 | digits[0] << 6
-
-    def assemble_jsr(self, line):
-        digits = self.get_digits(line, 'jsr ID')
-        digits[0] = (self.labels[digits[0]] - (self.orig + 1))
-        self.assert_max_digit_lengths(digits, [11])
-        return 0x4000 | 0x1 << 11 | digits[0]
-
-    def assemble_jsrr(self, line):
-        digits = self.get_digits(line, 'jsrr REG')
-        self.assert_max_digit_lengths(digits, [3])
-        return 0x4000 | digits[0] << 6
-
-    def assemble_ld(self, line):
-        digits = self.get_digits(line, 'ld REG, ID')
-        digits[1] = (self.labels[digits[1]] - (self.orig + 1))
-        self.assert_max_digit_lengths(digits, [3, 9])
-        return 0x2000 | digits[0] << 9 | digits[1] & 0x1FF
-
-    def assemble_ldi(self, line):
-        digits = self.get_digits(line, 'ldi REG, ID')
-        digits[1] = (self.labels[digits[1]] - (self.orig + 1))
-        self.assert_max_digit_lengths(digits, [3, 9])
-        return 0xA000 | digits[0] << 9 | digits[1] & 0x1FF
-
-    def assemble_ldr(self, line):
-        digits = self.get_digits(line, 'ldr REG, REG, NUM')
-        self.assert_max_digit_lengths(digits, [3, 3, 6])
-        return 0x6000 | digits[0] << 9 | digits[1] << 6 | digits[2]
-
-    def assemble_lea(self, line):
-        digits = self.get_digits(line, 'lea REG, ID')
-        digits[1] = (self.labels[digits[1]] - (self.orig + 1))
-        self.assert_max_digit_lengths(digits, [3, 9])
-        return 0xE000 | digits[0] << 9 | digits[1] & 0x1FF
-
-    def assemble_not(self, line):
-        digits = self.get_digits(line, 'not REG, REG')
-        self.assert_max_digit_lengths(digits, [3, 3])
-        return 0x9000 | digits[0] << 9 | digits[1] << 6 | 0x003F
-
-    def assemble_rti(self, line):
-        return 0x8000
-
-    def assemble_st(self, line):
-        digits = self.get_digits(line, 'st REG, ID')
-        digits[1] = (self.labels[digits[1]] - (self.orig + 1))
-        self.assert_max_digit_lengths(digits, [3, 9])
-        return 0x3000 | digits[0] << 9 | digits[1] & 0x1FF
-
-    def assemble_sti(self, line):
-        digits = self.get_digits(line, 'sti REG, ID')
-        digits[1] = (self.labels[digits[1]] - (self.orig + 1))
-        self.assert_max_digit_lengths(digits, [3, 9])
-        return 0xB000 | digits[0] << 9 | digits[1] & 0x1FF
-
-    def assemble_str(self, line):
-        digits = self.get_digits(line, 'str REG, REG, NUM')
-        self.assert_max_digit_lengths(digits, [3, 3, 6])
-        return 0x7000 | digits[0] << 9 | digits[1] << 6 | digits[2]
-
-    def assemble_trap(self, line):
-        digits = self.get_digits(line, 'trap NUM')
-        self.assert_max_digit_lengths(digits, [8])
-        return 0xF000 | digits[0]
-
-    def get_digits(self, raw_line, raw_pattern):
-        line = ' , '.join(raw_line.split(',')).split()
-        pattern = ' , '.join(raw_pattern.split(',')).split()
-        assert len(line) == len(pattern)
-        result = []
-        for tok, lexeme in list(zip(line, pattern)):
-            if lexeme == 'NUM':
-                if tok[0] == 'x':
-                    result.append(int(tok[1:], 16))
-                else:
-                    result.append(int(tok))
-            elif lexeme == 'REG':
-                assert tok[0].lower() == 'r'
-                result.append(int(tok[1:]))
-            elif lexeme == 'ID':
-                result.append(tok)
-            else:
-                assert(tok.lower() == lexeme.lower())
-        return result
 
 if __name__ == '__main__':
     try:
         Assembler().assemble_file('../res/test.asm')
-    except:
-        Assembler().assemble_file('res/test.asm')
\ No newline at end of file
+    except FileNotFoundError:
+        Assembler().assemble_file('res/test.asm')
@@ -0,0 +1,96 @@
+import argparse
+import io
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+
+from cache import ImageCache
+from lc3 import LC3
+
+
+def run_job(filename, inputs='', max_instructions=None, timeout=None,
+            engine='translator', cache_dir=None, native_traps=False):
+    machine = LC3(interactive=False)
+    if cache_dir is not None:
+        machine.assembler = ImageCache(cache_dir)
+    machine.keyboard.feed(inputs)
+    output = io.StringIO()
+    machine.display.stream = output
+    start = perf_counter()
+    try:
+        result = machine.exec_file(filename, engine=engine,
+                                   max_instructions=max_instructions,
+                                   timeout=timeout,
+                                   native_traps=native_traps)
+        halt_reason, pc, error = result.status, result.pc, None
+    except Exception as e:
+        halt_reason, pc, error = 'error', machine.pc, str(e)
+    return {
+        'filename': filename,
+        'halt_reason': halt_reason,
+        'error': error,
+        'output': output.getvalue(),
+        'instructions': machine.instruction_count,
+        'registers': list(machine.registers),
+        'pc': pc,
+        'elapsed': perf_counter() - start
+    }
+
+
+def run_batch(jobs, workers=None, max_instructions=None, timeout=None,
+              engine='translator', cache_dir=None, native_traps=False):
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(run_job, filename, inputs, max_instructions, timeout,
+                        engine, cache_dir, native_traps)
+            for filename, inputs in jobs
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def read_inputs(filename, default):
+    path = os.path.splitext(filename)[0] + '.in'
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+    return default
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run many LC-3 programs across a process pool.')
+    parser.add_argument('files', nargs='+',
+                        help='.asm files; a sibling .in file is used as the '
+                             'keyboard input of its program')
+    parser.add_argument('-j', '--workers', type=int, default=None)
+    parser.add_argument('--input', default=None,
+                        help='keyboard input for programs without a .in file')
+    parser.add_argument('--max-instructions', type=int, default=None)
+    parser.add_argument('--timeout', type=float, default=None)
+    parser.add_argument('--engine', default='translator',
+                        choices=['interpreter', 'translator'])
+    parser.add_argument('--cache-dir', default=None,
+                        help='reuse assembled images stored in this directory')
+    parser.add_argument('--native-traps', action='store_true',
+                        help='run the standard trap routines in Python '
+                             'instead of the ones loaded in memory')
+    args = parser.parse_args(argv)
+
+    default = b''
+    if args.input is not None:
+        with open(args.input, 'rb') as f:
+            default = f.read()
+    jobs = [(filename, read_inputs(filename, default))
+            for filename in args.files]
+    for result in run_batch(jobs, args.workers, args.max_instructions,
+                            args.timeout, args.engine, args.cache_dir,
+                            args.native_traps):
+        sys.stdout.write(json.dumps(result) + '\n')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tracemalloc
+from time import perf_counter
+
+from assembler import Assembler
+from disassembler import Disassembler
+from lc3 import LC3, ExecutionResult
+
+bench_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         '..', 'res', 'bench')
+workloads = ['arith', 'sort', 'fib', 'puts']
+
+
+def read_lines(name):
+    with open(os.path.join(bench_dir, name)) as f:
+        return f.readlines()
+
+
+def generated_source(count, seed=0):
+    rng = random.Random(seed)
+    lines = ['.orig x3000']
+    for i in range(count):
+        r1, r2, r3 = (rng.randrange(8) for _ in range(3))
+        target = rng.randrange(max(0, i - 200), min(count, i + 200))
+        kind = rng.randrange(6)
+        if kind == 0:
+            text = 'ADD R{}, R{}, #{}'.format(r1, r2, rng.randrange(-16, 16))
+        elif kind == 1:
+            text = 'AND R{}, R{}, R{}'.format(r1, r2, r3)
+        elif kind == 2:
+            text = 'LD R{}, L{}'.format(r1, target)
+        elif kind == 3:
+            text = 'BRnz L{}'.format(target)
+        elif kind == 4:
+            text = 'STR R{}, R{}, #{}'.format(r1, r2, rng.randrange(-32, 32))
+        else:
+            text = '.fill x{:04X}'.format(rng.randrange(1 << 16))
+        lines.append('L{} {} ; line {}'.format(i, text, i))
+    lines.append('.end')
+    return lines
+
+
+def program(name, engine, native_traps=False):
+    memory = Assembler().assemble(read_lines('os.asm') + read_lines(name))
+
+    def run():
+        machine = LC3(interactive=False)
+        machine.display.stream = io.StringIO()
+        result = machine.exec_memory(memory[:], engine=engine,
+                                     native_traps=native_traps)
+        if result.status != ExecutionResult.halted:
+            raise Exception('{} stopped with {}'.format(name, result))
+        return result.instructions
+    return run
+
+
+def assemble(lines, repeat=1):
+    def run():
+        assembler = Assembler()
+        for _ in range(repeat):
+            assembler.assemble(lines)
+        return len(lines) * repeat
+    return run
+
+
+def disassemble(memory):
+    words = list(memory)
+
+    def run():
+        Disassembler().disassemble(words)
+        return len(words)
+    return run
+
+
+def disassemble_image(memory):
+    from listing import ImageDisassembler
+
+    def run():
+        ImageDisassembler(memory).disassemble()
+        return len(memory)
+    return run
+
+
+def benchmarks():
+    small = read_lines('os.asm') + read_lines('sort.asm')
+    large = generated_source(30000)
+    image = Assembler().assemble(large)
+    suite = []
+    for name in workloads:
+        for engine in ['interpreter', 'translator']:
+            suite.append(('{}/{}'.format(name, engine), 'instructions/s',
+                          program(name + '.asm', engine)))
+    suite.append(('puts/native-traps', 'instructions/s',
+                  program('puts.asm', 'interpreter', native_traps=True)))
+    suite.append(('assemble/small', 'lines/s', assemble(small, 100)))
+    suite.append(('assemble/large', 'lines/s', assemble(large)))
+    suite.append(('disassemble/image', 'words/s', disassemble(image)))
+    suite.append(('listing/image', 'words/s', disassemble_image(image)))
+    return suite
+
+
+def measure(run, repeat):
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        work = run()
+        elapsed = perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    # a separate pass, since tracing allocations slows everything down
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'work': work, 'seconds': best, 'rate': work / best,
+            'peak_memory': peak}
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, result in sorted(results['benchmarks'].items()):
+        base = baseline['benchmarks'].get(name)
+        if base is None:
+            continue
+        change = result['rate'] / base['rate'] - 1
+        if change < -threshold:
+            regressions.append(name)
+        sys.stdout.write('{:<28} {:>14,.0f} vs {:>14,.0f} {:>+8.1%}{}\n'.format(
+            name, result['rate'], base['rate'], change,
+            '  REGRESSION' if change < -threshold else ''))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the emulator, assembler and disassembler.')
+    parser.add_argument('-o', '--output', default=None,
+                        help='write the results to this JSON file')
+    parser.add_argument('--baseline', default=None,
+                        help='compare against results saved with --output')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='slowdown relative to the baseline that counts '
+                             'as a regression (default 0.1)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--filter', default='',
+                        help='only run benchmarks whose name contains this')
+    args = parser.parse_args(argv)
+
+    results = {'python': platform.python_version(),
+               'platform': platform.platform(), 'benchmarks': {}}
+    for name, unit, run in benchmarks():
+        if args.filter not in name:
+            continue
+        try:
+            result = measure(run, args.repeat)
+        except ImportError as e:
+            sys.stdout.write('{:<28} skipped: {}\n'.format(name, e))
+            continue
+        result['unit'] = unit
+        results['benchmarks'][name] = result
+        sys.stdout.write('{:<28} {:>14,.0f} {:<15} {:>8.3f}s {:>10,} '
+                         'bytes peak\n'.format(name, result['rate'], unit,
+                                               result['seconds'],
+                                               result['peak_memory']))
+        sys.stdout.flush()
+    results['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
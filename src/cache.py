@@ -0,0 +1,43 @@
+import hashlib
+import os
+
+from assembler import Assembler
+from objfile import read_object, version
+
+
+class ImageCache:
+    def __init__(self, directory=None):
+        self.directory = directory or os.environ.get('LC3_CACHE_DIR') or \
+            os.path.join(os.path.expanduser('~'), '.cache', 'lc3')
+        self.labels = {}
+        self.segments = []
+
+    def path(self, source):
+        digest = hashlib.sha256(b'%d\0' % version + source).hexdigest()
+        return os.path.join(self.directory, digest + '.obj')
+
+    def assemble_file(self, filename):
+        with open(filename, 'rb') as f:
+            return self.assemble_source(f.read())
+
+    def assemble(self, lines):
+        # lines may come with or without their newlines
+        text = '\n'.join(line.rstrip('\n') for line in lines)
+        return self.assemble_source(text.encode('utf-8'))
+
+    def assemble_source(self, source):
+        path = self.path(source)
+        if os.path.exists(path):
+            memory, self.segments, self.labels = read_object(path)
+            return memory
+
+        assembler = Assembler()
+        memory = assembler.assemble(
+            source.decode('utf-8').splitlines(keepends=True))
+        self.segments, self.labels = assembler.segments, assembler.labels
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            assembler.write_object(memory, path)
+        except OSError:
+            pass  # an unwritable cache only costs the next run a reassembly
+        return memory
@@ -0,0 +1,263 @@
+import argparse
+import base64
+import io
+import json
+import os
+import socket
+import socketserver
+import stat
+import struct
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from time import monotonic, perf_counter
+
+from assembler import Assembler
+from lc3 import LC3
+from objfile import parse_object, read_object
+
+length_header = struct.Struct('>I')
+max_message = 1 << 24
+
+
+class ProtocolException(Exception):
+    pass
+
+
+def receive_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 16))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def send_message(sock, message):
+    data = json.dumps(message).encode('utf-8')
+    sock.sendall(length_header.pack(len(data)) + data)
+
+
+def receive_message(sock):
+    # a message is a 4 byte big-endian length followed by that many bytes of
+    # UTF-8 JSON; None means the peer closed the connection
+    header = receive_exactly(sock, length_header.size)
+    if header is None:
+        return None
+    length, = length_header.unpack(header)
+    if length > max_message:
+        raise ProtocolException('Message of {} bytes is too large'.format(
+            length))
+    data = receive_exactly(sock, length)
+    if data is None:
+        raise ProtocolException('Connection closed mid-message')
+    return json.loads(data.decode('utf-8'))
+
+
+@lru_cache(maxsize=64)
+def assemble_source(source):
+    assembler = Assembler()
+    memory = assembler.assemble(source.splitlines(keepends=True))
+    return memory, assembler.segments
+
+
+def read_image(filename):
+    if filename.endswith('.asm'):
+        assembler = Assembler()
+        return assembler.assemble_file(filename), assembler.segments
+    memory, segments, _ = read_object(filename)
+    return memory, segments
+
+
+class Worker:
+    def __init__(self, image=None, native_traps=False):
+        # the machine is booted once with the OS image; a program is laid
+        # over it and snapshotted, so runs of the same program only restore
+        # the pages they wrote and keep the OS and the program decoded and
+        # translated between requests
+        self.machine = LC3(interactive=False)
+        memory = image[0] if image is not None else \
+            array('H', [0]) * LC3.mem_size
+        self.machine.load(memory, native_traps=native_traps)
+        self.boot = self.machine.snapshot()
+        self.base = self.boot
+        self.key = None
+        self.segments = []
+
+    def program(self, request):
+        if 'object' in request:
+            memory, segments, _ = parse_object(
+                base64.b64decode(request['object']))
+            return request['object'], memory, segments
+        if 'source' in request:
+            return (request['source'],) + assemble_source(request['source'])
+        raise ProtocolException('A request needs a source or an object')
+
+    def load(self, request):
+        machine = self.machine
+        key, memory, segments = self.program(request)
+        if key != self.key:
+            machine.restore(self.base)
+            machine.place(self.boot.memory, self.segments)
+            machine.place(memory, segments)
+            self.base = machine.snapshot()
+            self.key = key
+            self.segments = segments
+        machine.restore(self.base)
+
+    def run(self, request):
+        machine = self.machine
+        start = perf_counter()
+        output = io.StringIO()
+        try:
+            self.load(request)
+            machine.display.stream = output
+            machine.pc = int(request.get('origin', 0x3000)) & 0xFFFF
+            machine.keyboard.feed(request.get('input', ''))
+            deadline = None
+            if request.get('timeout') is not None:
+                deadline = monotonic() + request['timeout']
+            result = machine.run(request.get('engine', 'translator'),
+                                 request.get('max_instructions'), deadline)
+            machine.display.flush()
+            halt_reason, pc, error = result.status, result.pc, None
+            instructions = result.instructions
+        except Exception as e:
+            halt_reason, pc, error = 'error', machine.pc, str(e)
+            instructions = 0
+        return {
+            'halt_reason': halt_reason,
+            'error': error,
+            'output': output.getvalue(),
+            'instructions': instructions,
+            'registers': list(machine.registers),
+            'pc': pc,
+            'elapsed': perf_counter() - start
+        }
+
+
+worker = None
+
+
+def init_worker(image, native_traps):
+    global worker
+    worker = Worker(image, native_traps)
+
+
+def run_request(request):
+    return worker.run(request)
+
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request = receive_message(self.request)
+            except (ProtocolException, ValueError) as e:
+                send_message(self.request, {'halt_reason': 'error',
+                                            'error': str(e)})
+                return
+            if request is None:
+                return
+            response = self.server.pool.submit(run_request, request).result()
+            send_message(self.request, response)
+
+
+class Daemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, image=None, native_traps=False, workers=None):
+        if os.path.exists(path):
+            # only a socket left behind by an earlier daemon is replaced
+            if not stat.S_ISSOCK(os.stat(path).st_mode):
+                raise Exception('{} exists and is not a socket'.format(path))
+            os.unlink(path)
+        workers = workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(workers, initializer=init_worker,
+                                        initargs=(image, native_traps))
+        # start every worker now rather than on its first request
+        for future in [self.pool.submit(int) for _ in range(workers)]:
+            future.result()
+        socketserver.UnixStreamServer.__init__(self, path, RequestHandler)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        self.pool.shutdown()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class Client:
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+
+    def run(self, source=None, image=None, inputs='', **limits):
+        request = dict(limits, input=inputs)
+        if image is not None:
+            request['object'] = base64.b64encode(image).decode('ascii')
+        else:
+            request['source'] = source
+        send_message(self.sock, request)
+        response = receive_message(self.sock)
+        if response is None:
+            raise ProtocolException('The daemon closed the connection')
+        return response
+
+    def close(self):
+        self.sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Serve LC-3 run requests from machines kept booted.')
+    parser.add_argument('--socket', default='lc3.sock')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve = subparsers.add_parser('serve')
+    serve.add_argument('--os', default=None,
+                       help='.asm source or object file loaded into every '
+                            'machine before its program')
+    serve.add_argument('--native-traps', action='store_true')
+    serve.add_argument('-j', '--workers', type=int, default=None)
+    run = subparsers.add_parser('run')
+    run.add_argument('file', help='.asm source or object file')
+    run.add_argument('--input', default='',
+                     help='keyboard input for the program')
+    run.add_argument('--max-instructions', type=int, default=None)
+    run.add_argument('--timeout', type=float, default=None)
+    run.add_argument('--engine', default='translator',
+                     choices=['interpreter', 'translator'])
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        image = read_image(args.os) if args.os is not None else None
+        with Daemon(args.socket, image, args.native_traps,
+                    args.workers) as server:
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+        return 0
+
+    client = Client(args.socket)
+    try:
+        limits = {'max_instructions': args.max_instructions,
+                  'timeout': args.timeout, 'engine': args.engine}
+        if args.file.endswith('.asm'):
+            with open(args.file) as f:
+                response = client.run(f.read(), inputs=args.input, **limits)
+        else:
+            with open(args.file, 'rb') as f:
+                response = client.run(image=f.read(), inputs=args.input,
+                                      **limits)
+    finally:
+        client.close()
+    sys.stdout.write(json.dumps(response) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
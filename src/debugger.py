@@ -0,0 +1,140 @@
+import sys
+from functools import partial
+
+from lc3 import LC3, ExecutionException, ExecutionResult
+
+
+class BreakpointException(ExecutionException):
+    status = ExecutionResult.breakpoint
+
+
+class WatchpointException(ExecutionException):
+    status = ExecutionResult.watchpoint
+
+
+class Debugger:
+    def __init__(self, machine):
+        self.machine = machine
+        self.reads = {}
+        self.writes = {}
+        self.skip = None
+        self.hit = None
+
+    def address(self, location):
+        if isinstance(location, str):
+            labels = self.machine.assembler.labels
+            if location not in labels:
+                raise Exception('Unknown label: ' + location)
+            return labels[location]
+        return location & 0xFFFF
+
+    def break_at(self, location, condition=None):
+        # breakpoints live in the decode path: the handler cached for the
+        # address is swapped for one that checks in before dispatching, so
+        # every other instruction runs untouched
+        address = self.address(location)
+        self.machine.breakpoints[address] = partial(self.check, condition)
+        self.machine.decoded.pop(address, None)
+        self.machine.translator.invalidate(address)
+        return address
+
+    def clear(self, location):
+        address = self.address(location)
+        self.machine.breakpoints.pop(address, None)
+        self.machine.decoded.pop(address, None)
+        self.machine.translator.invalidate(address)
+
+    def watch(self, location, read=False, write=True, condition=None):
+        address = self.address(location)
+        if read:
+            self.reads[address] = condition
+        if write:
+            self.writes[address] = condition
+        self.hook()
+        return address
+
+    def unwatch(self, location):
+        address = self.address(location)
+        self.reads.pop(address, None)
+        self.writes.pop(address, None)
+        self.hook()
+
+    def hook(self):
+        # watchpoints shadow the machine's read and write methods, which
+        # every load, store and device access already goes through
+        machine = self.machine
+        if self.reads or self.writes:
+            machine.read = self.read
+            machine.write = self.write
+        else:
+            machine.__dict__.pop('read', None)
+            machine.__dict__.pop('write', None)
+
+    def check(self, condition, address, handler):
+        if address != self.skip and \
+                (condition is None or condition(self.machine)):
+            self.machine.pc = address
+            self.hit = (ExecutionResult.breakpoint, address)
+            raise BreakpointException(
+                'Breakpoint at x{:04X}'.format(address))
+        handler()
+
+    def trigger(self, watches, address):
+        pc = (self.machine.pc - 1) & 0xFFFF
+        condition = watches[address]
+        if pc != self.skip and (condition is None or
+                                condition(self.machine)):
+            self.machine.pc = pc
+            self.hit = (ExecutionResult.watchpoint, address)
+            raise WatchpointException(
+                'Watchpoint on x{:04X} at x{:04X}'.format(address, pc))
+
+    def read(self, address):
+        if address in self.reads:
+            self.trigger(self.reads, address)
+        return LC3.read(self.machine, address)
+
+    def write(self, address, value):
+        if address in self.writes:
+            self.trigger(self.writes, address)
+        LC3.write(self.machine, address, value)
+
+    def step(self):
+        machine = self.machine
+        self.hit = None
+        self.skip = machine.pc
+        try:
+            return machine.run('interpreter', 1)
+        finally:
+            self.skip = None
+            machine.display.flush()
+
+    def cont(self, engine='interpreter', max_instructions=None,
+             deadline=None):
+        # the instruction at pc is stepped past first so that resuming from
+        # a breakpoint or watchpoint doesn't immediately stop on it again
+        limit = sys.maxsize if max_instructions is None else max_instructions
+        if limit <= 0:
+            return self.machine.run(engine, 0, deadline)
+        result = self.step()
+        if result.status != ExecutionResult.budget or limit == 1:
+            return result
+        try:
+            rest = self.machine.run(engine, limit - 1, deadline)
+        finally:
+            self.machine.display.flush()
+        return ExecutionResult(rest.status, rest.instructions + 1, rest.pc)
+
+    def step_over(self, engine='interpreter'):
+        machine = self.machine
+        opcode = machine.memory[machine.pc] >> 12
+        if opcode != 4 and opcode != 15:
+            return self.step()
+        following = (machine.pc + 1) & 0xFFFF
+        if following in machine.breakpoints:
+            return self.cont(engine)
+        self.break_at(following)
+        try:
+            return self.cont(engine)
+        finally:
+            self.clear(following)
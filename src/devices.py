@@ -0,0 +1,106 @@
+import sys
+import threading
+from collections import deque
+
+
+class Keyboard:
+    capacity = 1 << 16
+
+    def __init__(self, capacity=None):
+        self.inputs = deque()
+        self.capacity = capacity or Keyboard.capacity
+        self.condition = threading.Condition()
+        self.reader = None
+        self.data = 0
+
+    @staticmethod
+    def codes(data):
+        if isinstance(data, str):
+            return [ord(char) & 0xFFFF for char in data]
+        return data
+
+    def feed(self, data):
+        with self.condition:
+            self.inputs.extend(self.codes(data))
+            self.condition.notify_all()
+
+    def feed_file(self, filename):
+        with open(filename, 'rb') as f:
+            self.feed(f.read())
+
+    def put(self, data):
+        with self.condition:
+            for code in self.codes(data):
+                while len(self.inputs) >= self.capacity:
+                    self.condition.wait()
+                self.inputs.append(code)
+                self.condition.notify_all()
+
+    def listen(self, stream=None):
+        if self.reader is not None and self.reader.is_alive():
+            return
+
+        def read_input():
+            source = stream or sys.stdin
+            while True:
+                line = source.readline()
+                if not line:
+                    break
+                self.put(line)
+            with self.condition:
+                self.reader = None
+                self.condition.notify_all()
+
+        self.reader = threading.Thread(target=read_input)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def listening(self):
+        return self.reader is not None and self.reader.is_alive()
+
+    def wait(self, timeout=None):
+        # also returns once the reader runs out of input
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.ready() or not self.listening(), timeout)
+            return self.ready()
+
+    def ready(self):
+        return bool(self.inputs)
+
+    def read_status(self):
+        return 0x8000 if self.inputs else 0
+
+    def read_data(self):
+        if self.inputs:
+            with self.condition:
+                self.data = self.inputs.popleft()
+                self.condition.notify_all()
+        return self.data
+
+
+class Display:
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.buffer = []
+
+    def read_status(self):
+        return 0x8000
+
+    def write_data(self, value):
+        char = chr(value)
+        self.buffer.append(char)
+        if char == '\n':
+            self.flush()
+
+    def write_text(self, text):
+        self.buffer.append(text)
+        if '\n' in text:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            stream = self.stream or sys.stdout
+            stream.write(''.join(self.buffer))
+            stream.flush()
+            self.buffer = []
@@ -1,8 +1,13 @@
+import argparse
+import sys
+
+from assembler import Assembler
+from objfile import iter_image, iter_object
+
+
 def sext(value, digits):
-    if value & (0x1 << (digits - 1)) == 0:
-        return value & ~(~0 << (digits - 1))
-    else:
-        return -(-value & ~(~0 << (digits - 1)))
+    sign = 1 << (digits - 1)
+    return ((value & ~(~0 << digits)) ^ sign) - sign
 
 
 class Disassembler:
@@ -29,6 +34,17 @@ class Disassembler:
     def disassemble(self, lines):
         return [self.disassemble_line(line) for line in lines if line != 0]
 
+    def stream(self, words, origin=0, skip_zero=True):
+        return self.stream_records(enumerate(words, origin), skip_zero)
+
+    def stream_records(self, records, skip_zero=True):
+        # lazily formats (address, word) records from any source, so an
+        # image, object file or trace is never held in memory as a whole
+        for address, word in records:
+            if word or not skip_zero:
+                yield 'x{:04X}  x{:04X}  {}'.format(
+                    address & 0xFFFF, word, self.disassemble_line(word))
+
     def disassemble_line(self, line):
         return self.instrs[(line >> 12) & 0xF](line)
 
@@ -120,4 +136,40 @@ class Disassembler:
         else:
             return 'TRAP {}'.format(index)
 
-print('imported')
\ No newline at end of file
+
+
+def read_records(filename, trace=False, origin=0x3000):
+    if trace:
+        from tracer import read_trace
+        for pc, instr, _, _ in read_trace(filename):
+            yield pc, instr
+    elif filename.endswith('.asm'):
+        with open(filename) as f:
+            yield from Assembler().assemble_records(f)
+    elif filename.endswith('.obj'):
+        yield from iter_object(filename)
+    else:
+        yield from iter_image(filename, origin)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Disassemble LC-3 words one line at a time.')
+    parser.add_argument('file', help='.asm source, object file, trace (with '
+                                     '--trace) or raw big-endian image')
+    parser.add_argument('--trace', action='store_true',
+                        help='the file is a trace written by tracer.py')
+    parser.add_argument('--origin', default='x3000',
+                        help='load address of a raw image')
+    parser.add_argument('--all', action='store_true',
+                        help='also list zero words')
+    args = parser.parse_args(argv)
+
+    records = read_records(args.file, args.trace,
+                           int(args.origin.lstrip('xX'), 16))
+    for line in Disassembler().stream_records(records, not args.all):
+        sys.stdout.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+import argparse
+import json
+import os
+import random
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from assembler import Assembler
+from lc3 import LC3, ExecutionException, ExecutionResult
+from objfile import read_object
+
+out_of_range = 'out_of_range'
+crash_statuses = {ExecutionResult.illegal_opcode,
+                  ExecutionResult.privilege_violation, out_of_range}
+interesting_words = [0, 1, 2, 10, 32, 48, 65, 0x7FFF, 0x8000, 0xFFFE,
+                     0xFFFF]
+max_input = 256
+
+
+class OutOfRangeException(ExecutionException):
+    status = out_of_range
+
+
+class NullStream:
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+
+def run_covered(machine, edges, allowed, max_instructions):
+    # a copy of the interpreter loop that records every pc -> next pc
+    # transition and stops once execution leaves the loaded image
+    memory = machine.memory
+    decoded = machine.decoded
+    mcr = LC3.mcr
+    stop = 0
+    count = 0
+    pc = previous = machine.pc
+    status = ExecutionResult.halted
+    try:
+        while memory[mcr] != 0:
+            if count >= stop or machine.end_slice:
+                ended, stop = machine.next_slice(count, max_instructions,
+                                                 None)
+                if ended is not None:
+                    status = ended
+                    break
+            pc = machine.pc
+            if not allowed[pc]:
+                # reported at the instruction that left the image, so one
+                # bad jump doesn't show up as a crash per target
+                machine.pc = previous
+                raise OutOfRangeException(
+                    'Execution left the image at x{:04X}'.format(pc))
+            edges.add(previous << 16 | pc)
+            previous = pc
+            handler = decoded.get(pc)
+            if handler is None:
+                handler = machine.decode(pc)
+            machine.pc = (pc + 1) & 0xFFFF
+            handler()
+            count += 1
+        pc = machine.pc
+    except ExecutionException as e:
+        status = e.status
+        pc = machine.pc
+    finally:
+        machine.instruction_count += count
+    return ExecutionResult(status, count, pc)
+
+
+def mutate(rng, data, corpus):
+    keys, registers = bytearray(data[0]), list(data[1])
+    for _ in range(rng.randint(1, 4)):
+        choice = rng.randrange(8)
+        if choice == 0 and keys:
+            keys[rng.randrange(len(keys))] ^= 1 << rng.randrange(8)
+        elif choice == 1 and keys:
+            keys[rng.randrange(len(keys))] = rng.randrange(256)
+        elif choice == 2:
+            keys.insert(rng.randint(0, len(keys)), rng.randrange(32, 127))
+        elif choice == 3 and keys:
+            del keys[rng.randrange(len(keys))]
+        elif choice == 4:
+            other = rng.choice(corpus)[0]
+            keys[rng.randint(0, len(keys)):] = \
+                other[rng.randint(0, len(other)):]
+        elif choice == 5:
+            keys.append(rng.choice(b'\n\r 0aAzZ9'))
+        elif choice == 6:
+            registers[rng.randrange(8)] = rng.choice(interesting_words)
+        else:
+            i = rng.randrange(8)
+            registers[i] = (registers[i] + rng.randint(-16, 16)) & 0xFFFF
+    return bytes(keys[:max_input]), tuple(registers)
+
+
+class Worker:
+    def __init__(self, memory, segments, origin, max_instructions,
+                 native_traps):
+        self.machine = LC3(interactive=False)
+        self.machine.display.stream = NullStream()
+        self.machine.load(memory, origin, native_traps)
+        self.snapshot = self.machine.snapshot()
+        self.allowed = bytearray(1 << 16)
+        for start, end in segments:
+            self.allowed[start:end] = b'\x01' * (end - start)
+        self.max_instructions = max_instructions
+
+    def execute(self, data):
+        keys, registers = data
+        machine = self.machine
+        machine.restore(self.snapshot)
+        machine.registers[:] = array('H', registers)
+        machine.keyboard.feed(keys)
+        edges = set()
+        result = run_covered(machine, edges, self.allowed,
+                             self.max_instructions)
+        return result, edges
+
+
+worker = None
+
+
+def init_worker(*args):
+    global worker
+    worker = Worker(*args)
+
+
+def fuzz_round(seed, corpus, coverage, iterations):
+    rng = random.Random(seed)
+    coverage = set(coverage)
+    corpus = list(corpus)
+    found = []
+    crashes = []
+    hangs = []
+    for _ in range(iterations):
+        data = mutate(rng, rng.choice(corpus), corpus)
+        result, edges = worker.execute(data)
+        if not edges <= coverage:
+            coverage |= edges
+            corpus.append(data)
+            found.append((data, edges))
+        if result.status in crash_statuses:
+            crashes.append((result.status, result.pc, data))
+        elif result.status == ExecutionResult.budget:
+            hangs.append((result.pc, data))
+    return found, crashes, hangs
+
+
+class Fuzzer:
+    def __init__(self, memory, segments, origin=0x3000,
+                 max_instructions=10000, native_traps=False, workers=None,
+                 seed=0):
+        self.args = (memory, segments, origin, max_instructions,
+                     native_traps)
+        self.workers = workers or os.cpu_count() or 1
+        self.rng = random.Random(seed)
+        self.corpus = [(b'', (0,) * LC3.num_registers)]
+        self.coverage = set()
+        self.crashes = {}
+        self.hangs = {}
+        self.executions = 0
+        self.elapsed = 0.0
+
+    def add_seed(self, keys, registers=None):
+        self.corpus.append((bytes(keys),
+                            tuple(registers or (0,) * LC3.num_registers)))
+
+    def merge(self, found, crashes, hangs):
+        for data, edges in found:
+            if not edges <= self.coverage:
+                self.coverage |= edges
+                self.corpus.append(data)
+        for status, pc, data in crashes:
+            self.crashes.setdefault((status, pc), data)
+        for pc, data in hangs:
+            self.hangs.setdefault(pc, data)
+
+    def run(self, rounds=10, iterations=1000, progress=None):
+        # workers fuzz independently for a round, then their discoveries
+        # are merged and shared before the next one
+        start = perf_counter()
+        with ProcessPoolExecutor(self.workers, initializer=init_worker,
+                                 initargs=self.args) as pool:
+            for _ in range(rounds):
+                futures = [pool.submit(fuzz_round, self.rng.getrandbits(32),
+                                       self.corpus, self.coverage,
+                                       iterations)
+                           for _ in range(self.workers)]
+                for future in futures:
+                    self.merge(*future.result())
+                self.executions += iterations * self.workers
+                self.elapsed = perf_counter() - start
+                if progress is not None:
+                    progress(self)
+        return self
+
+    def report(self):
+        return {
+            'executions': self.executions,
+            'executions_per_second': self.executions / self.elapsed,
+            'edges': len(self.coverage),
+            'corpus': len(self.corpus),
+            'crashes': [{'status': status, 'pc': pc, 'input': keys.hex(),
+                         'registers': list(registers)}
+                        for (status, pc), (keys, registers)
+                        in sorted(self.crashes.items())],
+            'hangs': [{'pc': pc, 'input': keys.hex(),
+                       'registers': list(registers)}
+                      for pc, (keys, registers) in sorted(self.hangs.items())]
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Coverage-guided fuzzing of keyboard input and initial '
+                    'registers.')
+    parser.add_argument('file', help='.asm source or an object file')
+    parser.add_argument('--origin', default='x3000')
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=1000,
+                        help='executions per worker per round')
+    parser.add_argument('-j', '--workers', type=int, default=None)
+    parser.add_argument('--max-instructions', type=int, default=10000,
+                        help='runs longer than this are reported as hangs')
+    parser.add_argument('--native-traps', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.file.endswith('.asm'):
+        assembler = Assembler()
+        memory = assembler.assemble_file(args.file)
+        segments = assembler.segments
+    else:
+        memory, segments, _ = read_object(args.file)
+    fuzzer = Fuzzer(memory, segments, int(args.origin.lstrip('xX'), 16),
+                    args.max_instructions, args.native_traps, args.workers,
+                    args.seed)
+
+    def progress(f):
+        sys.stderr.write('{} execs, {:.0f}/s, {} edges, {} crashes, '
+                         '{} hangs\n'.format(f.executions,
+                                             f.executions / f.elapsed,
+                                             len(f.coverage),
+                                             len(f.crashes), len(f.hangs)))
+    fuzzer.run(args.rounds, args.iterations, progress)
+    sys.stdout.write(json.dumps(fuzzer.report(), indent=2) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+from array import array
+
+from assembler import Assembler, AssemblerException, tokenize
+
+
+def blank_memory():
+    return array('H', [0]) * (1 << 16)
+
+
+def split_segments(lines):
+    segments = []
+    current = None
+    for i, line in enumerate(lines):
+        directives = [tok.lower() for tok in tokenize(line)]
+        if '.orig' in directives:
+            current = (i, [])
+            segments.append(current)
+        if current is None:
+            if directives:
+                raise AssemblerException(
+                    'Line {}: Code outside of a .orig/.end segment'.format(
+                        i + 1))
+            continue
+        current[1].append(line)
+        if '.end' in directives:
+            current = None
+    return segments
+
+
+class Segment:
+    def __init__(self, lines, first_line, scratch):
+        assembler = Assembler()
+        assembler.assemble_lines(lines, scratch, first_line)
+        assembler.backpatch(scratch, strict=False)
+        self.key = tuple(lines)
+        self.start, self.end = assembler.segments[0]
+        self.words = scratch[self.start:self.end]
+        self.labels = assembler.labels
+        self.fixups = assembler.fixups
+        self.references = {label for _, label, _, _ in self.fixups}
+        self.linked = None
+        scratch[self.start:self.end] = array('H', [0]) * len(self.words)
+
+    def link(self, labels, scratch):
+        assembler = Assembler()
+        assembler.labels = labels
+        assembler.fixups = list(self.fixups)
+        scratch[self.start:self.end] = self.words
+        assembler.backpatch(scratch)
+        linked = scratch[self.start:self.end]
+        scratch[self.start:self.end] = array('H', [0]) * len(self.words)
+        return linked
+
+
+class IncrementalAssembler:
+    def __init__(self):
+        self.segments = []
+        self.labels = {}
+        self.memory = blank_memory()
+
+    def update(self, lines):
+        scratch = blank_memory()
+        previous = {}
+        for segment in self.segments:
+            previous.setdefault(segment.key, []).append(segment)
+
+        segments = []
+        for first_line, chunk in split_segments(list(lines)):
+            reused = previous.get(tuple(chunk))
+            if reused:
+                segments.append(reused.pop())
+            else:
+                segment = Segment(chunk, first_line, scratch)
+                segments.append(segment)
+
+        labels = {}
+        for segment in segments:
+            for name, address in segment.labels.items():
+                if name in labels:
+                    raise AssemblerException(
+                        'Duplicate Symbol Found: {} already defined'.format(
+                            name))
+                labels[name] = address
+        moved = {name for name in set(labels) | set(self.labels)
+                 if labels.get(name) != self.labels.get(name)}
+
+        relink = [segment for segment in segments
+                  if segment.linked is None or segment.references & moved]
+        linked = [segment.link(labels, scratch) for segment in relink]
+        for segment, words in zip(relink, linked):
+            segment.linked = words
+
+        memory = blank_memory()
+        for segment in segments:
+            memory[segment.start:segment.end] = segment.linked
+
+        touched = list(relink)
+        for stale in previous.values():
+            touched.extend(stale)
+        diff = {}
+        for segment in touched:
+            for address in range(segment.start, segment.end):
+                if memory[address] != self.memory[address]:
+                    diff[address] = memory[address]
+
+        self.segments = segments
+        self.labels = labels
+        self.memory = memory
+        return diff
@@ -1,109 +1,541 @@
 import sys
-import threading
+from array import array
+from functools import partial
 from random import randint
+from time import monotonic
 
 from assembler import Assembler
+from devices import Display, Keyboard
+from objfile import read_object
+from profiler import Profile
+from translator import Translator
+
+
+class ExecutionResult:
+    halted = 'halted'
+    budget = 'budget'
+    timeout = 'timeout'
+    illegal_opcode = 'illegal_opcode'
+    privilege_violation = 'privilege_violation'
+    breakpoint = 'breakpoint'
+    watchpoint = 'watchpoint'
+    waiting = 'waiting'
+
+    def __init__(self, status, instructions, pc):
+        self.status = status
+        self.instructions = instructions
+        self.pc = pc
+
+    def __repr__(self):
+        return 'ExecutionResult({}, instructions={}, pc=x{:04X})'.format(
+            self.status, self.instructions, self.pc)
+
+
+class ExecutionException(Exception):
+    status = None
+
+
+class IllegalOpcodeException(ExecutionException):
+    status = ExecutionResult.illegal_opcode
+
+
+class PrivilegeModeException(ExecutionException):
+    status = ExecutionResult.privilege_violation
+
+
+class InputTimeoutException(ExecutionException):
+    status = ExecutionResult.timeout
+
+
+class InputWaitException(ExecutionException):
+    status = ExecutionResult.waiting
+
+
+class Snapshot:
+    def __init__(self, machine):
+        self.memory = machine.memory[:]
+        self.registers = machine.registers[:]
+        self.pc = machine.pc
+        self.psr = machine.psr
+        self.ssp = machine.ssp
+        self.usp = machine.usp
+        self.instruction_count = machine.instruction_count
+        self.inputs = tuple(machine.keyboard.inputs)
+        self.data = machine.keyboard.data
 
 
 class LC3:
-    mem_size = 0xFFFF
+    mem_size = 0x10000
     word_size = 16
+    word_mask = 0xFFFF
     num_registers = 8
     kbsr = 0xFE00
     kbdr = 0xFE02
     dsr = 0xFE04
     ddr = 0xFE06
     mcr = 0xFFFE
-
-    def __init__(self):
-        self.memory = []
-        self.registers = []
+    device_base = 0xFE00
+    initial_psr = 0x8002  # user mode, priority 0, Z set
+    initial_ssp = 0x3000
+    check_interval = 1 << 16
+    interrupt_interval = 1 << 10
+    interrupt_enable = 0x4000
+    interrupt_table = 0x0100
+    keyboard_vector = 0x80
+    display_vector = 0x81
+    device_priority = 4
+    page_bits = 8
+    in_prompt = 'Enter a single character: '
+    spin = 0x0FFF  # BRnzp #-1
+
+    def __init__(self, interactive=True):
+        self.memory = array('H')
+        self.registers = array('H')
         self.pc = 0
-        self.psr = 0
-        self.instr = None
-        self.inputs = ''
-        self.ssp = 0x3000
+        self.psr = LC3.initial_psr
+        self.interactive = interactive
+        self.instruction_count = 0
+        self.keyboard = Keyboard()
+        self.display = Display()
+        self.ssp = LC3.initial_ssp
+        self.usp = 0
+        self.interrupts = False
+        self.end_slice = False
+        self.dirty = bytearray(LC3.mem_size >> LC3.page_bits)
+        self.base = None
+        self.native_traps = False
+        self.prompted = False
+        self.deadline = None
+        self.blocking_input = True
+        self.polled = False
+        self.profile = None
+        self.profiled = None
+        self.breakpoints = {}
         self.zero_registers()
         self.isr_registers = []
         self.assembler = Assembler()
-        self.instrs = [
-            self.BR, self.ADD, self.LD, self.ST, self.JSR, self.AND,
-            self.LDR, self.STR, self.RTI, self.NOT, self.LDI,
-            self.STI, self.JMP, None, self.LEA, self.TRAP
+        self.decoded = {}
+        self.decoders = [
+            self.decode_br, self.decode_add,
+            self.decode_dr_pc_offset_9(self.LD),
+            self.decode_dr_pc_offset_9(self.ST),
+            self.decode_jsr, self.decode_and,
+            self.decode_dr_base_offset_6(self.LDR),
+            self.decode_dr_base_offset_6(self.STR),
+            self.decode_rti, self.decode_not,
+            self.decode_dr_pc_offset_9(self.LDI),
+            self.decode_dr_pc_offset_9(self.STI),
+            self.decode_jmp, None,
+            self.decode_dr_pc_offset_9(self.LEA), self.decode_trap
         ]
+        self.traps = {
+            0x20: self.GETC, 0x21: self.OUT, 0x22: self.PUTS,
+            0x23: self.IN, 0x24: self.PUTSP, 0x25: self.HALT
+        }
+        self.translator = Translator(self)
+        self.engines = ['interpreter', 'translator']
 
     def reset_device_registers(self):
         self.memory[LC3.kbsr] = 0
-        self.memory[LC3.dsr] = -1
+        self.memory[LC3.dsr] = 0
         self.memory[LC3.kbdr] = 0
         self.memory[LC3.ddr] = 0
         self.memory[LC3.mcr] = 1
+        self.interrupts = False
+
+    def read_device(self, address):
+        if address == LC3.kbsr:
+            status = self.keyboard.read_status()
+            if not status:
+                self.display.flush()  # the program is waiting for input
+                self.polled = True
+            return status | self.memory[address] & LC3.interrupt_enable
+        elif address == LC3.kbdr:
+            return self.keyboard.read_data()
+        elif address == LC3.dsr:
+            return self.display.read_status() | \
+                self.memory[address] & LC3.interrupt_enable
+        return self.memory[address]
+
+    def write_device(self, address, value):
+        if address == LC3.ddr:
+            self.display.write_data(value)
+        elif address == LC3.kbsr or address == LC3.dsr:
+            # only the interrupt enable bit of a status register is writable
+            self.memory[address] = value & LC3.interrupt_enable
+            self.update_interrupts()
+            # the run loop rechecks at once, so an interrupt that is already
+            # pending is taken right after the store that enabled it
+            self.end_slice = True
+        else:
+            self.memory[address] = value
+
+    def update_interrupts(self):
+        self.interrupts = bool((self.memory[LC3.kbsr] | self.memory[LC3.dsr])
+                               & LC3.interrupt_enable)
+
+    def pending_interrupt(self):
+        if (self.psr >> 8) & 0x7 >= LC3.device_priority:
+            return None
+        if self.memory[LC3.kbsr] & LC3.interrupt_enable and \
+                self.keyboard.ready():
+            return LC3.keyboard_vector
+        if self.memory[LC3.dsr] & LC3.interrupt_enable:
+            return LC3.display_vector
+        return None
+
+    def check_interrupts(self):
+        vector = self.pending_interrupt()
+        if vector is not None:
+            self.interrupt(vector, LC3.device_priority)
+
+    def interrupt(self, vector, priority):
+        # the PSR and PC are pushed on the supervisor stack, switching to it
+        # first when the interrupt arrives in user mode; RTI undoes this
+        psr = self.psr
+        if psr & 0x8000:
+            self.usp = self.registers[6]
+            self.registers[6] = self.ssp
+        sp = (self.registers[6] - 1) & 0xFFFF
+        self.write(sp, psr)
+        sp = (sp - 1) & 0xFFFF
+        self.write(sp, self.pc)
+        self.registers[6] = sp
+        self.psr = (priority & 0x7) << 8
+        self.pc = self.memory[LC3.interrupt_table + vector]
 
     def zero_memory(self):
-        self.memory = [0] * LC3.mem_size
+        self.memory = array('H', [0]) * LC3.mem_size
+        self.base = None
 
     def randomize_memory(self):
-        self.memory = [randint(0, 1 << LC3.word_size)
-                       for _ in range(LC3.mem_size)]
+        self.base = None
+        self.memory = array('H', [randint(0, LC3.word_mask)
+                                  for _ in range(LC3.mem_size)])
 
     def zero_registers(self):
-        self.registers = [0] * LC3.num_registers
+        self.registers = array('H', [0]) * LC3.num_registers
 
     def randomize_registers(self):
-        self.registers = [
-            randint(0, 1 << LC3.word_size) for _ in range(LC3.num_registers)
-        ]
-
-    def listen_for_input(self):
-        def read_input():
-            self.inputs += input()
+        self.registers = array('H', [
+            randint(0, LC3.word_mask) for _ in range(LC3.num_registers)
+        ])
+
+    def listen_for_input(self, stream=None):
+        self.keyboard.listen(stream)
+
+    def exec_file(self, filename, **kwargs):
+        return self.exec_memory(self.assembler.assemble_file(filename),
+                                **kwargs)
+
+    def exec_lines(self, lines, **kwargs):
+        return self.exec_memory(self.assembler.assemble(lines), **kwargs)
+
+    def patch(self, words):
+        for address, word in words.items():
+            self.write(address, word)
+
+    def place(self, memory, segments):
+        # bulk counterpart of patch for loading a program over a booted
+        # machine; the pages are marked dirty so that restoring the boot
+        # snapshot removes the program again
+        for start, end in segments:
+            if end <= start:
+                continue
+            self.memory[start:end] = memory[start:end]
+            first = start >> LC3.page_bits
+            last = (end - 1) >> LC3.page_bits
+            self.dirty[first:last + 1] = b'\x01' * (last + 1 - first)
+            for address in self.cached(self.decoded, start, end):
+                del self.decoded[address]
+            owners = self.translator.owners
+            for address in self.cached(owners, start, end):
+                self.translator.invalidate(address)
+
+    def snapshot(self):
+        snapshot = Snapshot(self)
+        self.base = snapshot
+        self.dirty[:] = bytes(len(self.dirty))
+        return snapshot
+
+    def restore(self, snapshot):
+        if snapshot is self.base:
+            # only pages written since the snapshot was taken or last
+            # restored can differ from it; the device pages are cheap
+            # enough to copy unconditionally
+            size = 1 << LC3.page_bits
+            self.dirty[LC3.device_base >> LC3.page_bits:] = \
+                b'\x01' * ((LC3.mem_size - LC3.device_base) >> LC3.page_bits)
+            memory = self.memory
+            saved = snapshot.memory
+            owners = self.translator.owners
+            page = self.dirty.find(1)
+            while page >= 0:
+                start = page << LC3.page_bits
+                end = start + size
+                if memory[start:end] != saved[start:end]:
+                    # code sharing a page with data it writes stays cached
+                    # unless its own words changed
+                    for address in self.cached(self.decoded, start, end):
+                        if memory[address] != saved[address]:
+                            del self.decoded[address]
+                    for address in self.cached(owners, start, end):
+                        if memory[address] != saved[address]:
+                            self.translator.invalidate(address)
+                    memory[start:end] = saved[start:end]
+                page = self.dirty.find(1, page + 1)
+        else:
+            self.memory = snapshot.memory[:]
+            self.decoded = {}
+            self.translator.reset()
+            self.base = snapshot
+        self.dirty[:] = bytes(len(self.dirty))
+        self.registers[:] = snapshot.registers
+        self.pc = snapshot.pc
+        self.psr = snapshot.psr
+        self.ssp = snapshot.ssp
+        self.usp = snapshot.usp
+        self.update_interrupts()
+        self.instruction_count = snapshot.instruction_count
+        with self.keyboard.condition:
+            self.keyboard.inputs.clear()
+            self.keyboard.inputs.extend(snapshot.inputs)
+            self.keyboard.data = snapshot.data
+            self.keyboard.condition.notify_all()
+        self.display.buffer = []
+        self.prompted = False
+
+    @staticmethod
+    def cached(cache, start, end):
+        if len(cache) < end - start:
+            return [address for address in cache if start <= address < end]
+        return [address for address in range(start, end) if address in cache]
+
+    def fork(self, snapshot=None):
+        # the child runs the way its parent was set up to, but never reads
+        # stdin itself
+        child = LC3(interactive=False)
+        child.assembler = self.assembler
+        child.native_traps = self.native_traps
+        child.blocking_input = self.blocking_input
+        child.display.stream = self.display.stream
+        child.restore(snapshot or self.snapshot())
+        return child
+
+    def exec_object(self, filename, **kwargs):
+        self.zero_memory()
+        read_object(filename, self.memory)
+        return self.exec_memory(self.memory, **kwargs)
+
+    def exec_memory(self, memory, origin=0x3000, engine='interpreter',
+                    max_instructions=None, timeout=None, deadline=None,
+                    native_traps=False, profile=False, trace=None):
+        if engine not in self.engines:
+            raise Exception('Unknown engine: ' + str(engine))
+        self.load(memory, origin, native_traps, profile)
+
+        if self.interactive:
             self.listen_for_input()
-        t = threading.Thread(target=read_input)
-        t.daemon = True
-        t.start()
-
-    def exec_file(self, filename):
-        self.exec_memory(self.assembler.assemble_file(filename))
 
-    def exec_lines(self, lines):
-        self.exec_memory(self.assembler.assemble(lines))
-
-    def exec_memory(self, memory, origin=0x3000):
-        self.memory = memory
+        if timeout is not None:
+            timeout_deadline = monotonic() + timeout
+            if deadline is None or timeout_deadline < deadline:
+                deadline = timeout_deadline
+        try:
+            return self.run(engine, max_instructions, deadline, self.profile,
+                            trace)
+        finally:
+            self.display.flush()
+            if trace is not None:
+                trace.close()
+
+    def load(self, memory, origin=0x3000, native_traps=False, profile=False):
+        self.native_traps = native_traps
+        self.prompted = False
+        self.memory = to_words(memory)
+        self.base = None
+        self.decoded = {}
+        self.translator.reset()
         self.reset_device_registers()
         self.pc = origin
-
-        self.listen_for_input()
-
-        key_delay = 0
-        while self.memory[LC3.mcr] != 0:
-            key_delay += 1
-            if self.memory[LC3.dsr] < 0 and self.memory[LC3.ddr] != 0:
-                sys.stdout.write(chr(self.memory[LC3.ddr]))
-                sys.stdout.flush()
-                self.memory[LC3.dsr] = 1
-                self.memory[LC3.ddr] = 0
-            else:
-                self.memory[LC3.dsr] = -1
-
-            self.instr = self.memory[self.pc]
-            self.pc += 1
-
-            opcode = (self.instr >> 12) & 0xF
-
-            if self.instrs[opcode] is None:
-                raise Exception('IllegalOpcodeException')
+        self.psr = LC3.initial_psr
+        self.ssp = LC3.initial_ssp
+        self.usp = 0
+        self.instruction_count = 0
+        self.profile = Profile() if profile else None
+        self.profiled = None
+
+    def next_slice(self, count, limit, deadline):
+        # called by the run loops between slices: returns why the run ends,
+        # if it does, and where the next slice stops. Pending interrupts are
+        # only taken here, so slices are kept short while any are enabled
+        self.end_slice = False
+        if count >= limit:
+            return ExecutionResult.budget, count
+        if deadline is not None and monotonic() >= deadline:
+            return ExecutionResult.timeout, count
+        if self.interrupts:
+            self.check_interrupts()
+            return None, min(limit, count + LC3.interrupt_interval)
+        return None, min(limit, count + LC3.check_interval)
+
+    def run(self, engine='interpreter', max_instructions=None, deadline=None,
+            profile=None, trace=None):
+        if profile is not None and trace is not None:
+            raise Exception('A run can be profiled or traced, not both')
+        if profile is not None:
+            return self.run_profiled(profile, max_instructions, deadline)
+        if trace is not None:
+            return self.run_traced(trace, max_instructions, deadline)
+        self.profile_decoding(None)
+        memory = self.memory
+        decoded = self.decoded
+        blocks = None
+        if engine == 'translator' and 'read' not in self.__dict__ and \
+                'write' not in self.__dict__:
+            # translated blocks bypass read and write, so a machine with
+            # them shadowed (by watchpoints) stays in the interpreter
+            blocks = self.translator.blocks
+        translate = self.translator.translate
+        mcr = LC3.mcr
+        limit = sys.maxsize if max_instructions is None else max_instructions
+        stop = 0
+        count = 0
+        pc = self.pc
+        status = ExecutionResult.halted
+        self.deadline = deadline
+        try:
+            while memory[mcr] != 0:
+                if count >= stop or self.end_slice:
+                    ended, stop = self.next_slice(count, limit, deadline)
+                    if ended is not None:
+                        status = ended
+                        break
+                pc = self.pc
+                if blocks is not None and (pc in blocks or translate(pc)):
+                    # execute the basic block starting at pc
+                    count += blocks[pc](self, stop - count)
+                else:
+                    handler = decoded.get(pc)
+                    if handler is None:
+                        handler = self.decode(pc)
+                    self.pc = (pc + 1) & 0xFFFF
+                    handler()  # execute the current instruction
+                    count += 1
+            pc = self.pc
+        except ExecutionException as e:
+            status = e.status
+        finally:
+            self.instruction_count += count
+        return ExecutionResult(status, count, pc)
+
+    def run_profiled(self, profile, max_instructions=None, deadline=None):
+        # same loop as run, kept separate so that unprofiled runs pay nothing
+        self.profile_decoding(profile)
+        memory = self.memory
+        decoded = self.decoded
+        counts = profile.counts
+        profile.memory = memory
+        mcr = LC3.mcr
+        limit = sys.maxsize if max_instructions is None else max_instructions
+        stop = 0
+        count = 0
+        pc = self.pc
+        status = ExecutionResult.halted
+        self.deadline = deadline
+        try:
+            while memory[mcr] != 0:
+                if count >= stop or self.end_slice:
+                    ended, stop = self.next_slice(count, limit, deadline)
+                    if ended is not None:
+                        status = ended
+                        break
+                pc = self.pc
+                handler = decoded.get(pc)
+                if handler is None:
+                    handler = self.decode(pc)
+                self.pc = (pc + 1) & 0xFFFF
+                handler()
+                counts[pc] += 1
+                count += 1
+            pc = self.pc
+        except ExecutionException as e:
+            status = e.status
+        finally:
+            self.instruction_count += count
+        return ExecutionResult(status, count, pc)
+
+    def run_traced(self, trace, max_instructions=None, deadline=None):
+        memory = self.memory
+        decoded = self.decoded
+        registers = self.registers
+        ring = trace.ring
+        size = len(ring)
+        kinds = trace.kinds
+        stores = trace.stores
+        j = trace.cursor
+        mcr = LC3.mcr
+        limit = sys.maxsize if max_instructions is None else max_instructions
+        stop = 0
+        count = 0
+        pc = self.pc
+        status = ExecutionResult.halted
+        self.deadline = deadline
+
+        hook = self.__dict__.get('write')
+        write_through = self.write
+
+        def write(address, value):
+            stores[0] = address
+            stores[1] = value
+            write_through(address, value)
+
+        self.write = write
+        try:
+            while memory[mcr] != 0:
+                if count >= stop or self.end_slice:
+                    ended, stop = self.next_slice(count, limit, deadline)
+                    if ended is not None:
+                        status = ended
+                        break
+                pc = self.pc
+                handler = decoded.get(pc)
+                if handler is None:
+                    handler = self.decode(pc)
+                instr = memory[pc]
+                self.pc = (pc + 1) & 0xFFFF
+                handler()
+                # record (pc, instr, value, address); value is the changed
+                # register, or the stored word and its address for stores.
+                # Unused words are zeroed, not left over from the last lap
+                kind = kinds[instr]
+                ring[j] = pc
+                ring[j + 1] = instr
+                if kind < 8:
+                    ring[j + 2] = registers[kind]
+                    ring[j + 3] = 0
+                elif kind == 9:
+                    ring[j + 2] = stores[1]
+                    ring[j + 3] = stores[0]
+                else:
+                    ring[j + 2] = 0
+                    ring[j + 3] = 0
+                j += 4
+                if j == size:
+                    trace.spill()
+                    j = 0
+                count += 1
+            pc = self.pc
+        except ExecutionException as e:
+            status = e.status
+        finally:
+            if hook is None:
+                del self.write
             else:
-                self.instrs[opcode]()  # execute the current instruction
-
-            if self.inputs:
-                cur_input = ord(self.inputs[0])
-                self.inputs = self.inputs[1:]
-                self.memory[LC3.kbsr] |= 0x8000
-                self.memory[LC3.kbdr] = cur_input
-                key_delay = 0
-            elif key_delay > 2:
-                self.memory[LC3.kbsr] &= 0x7FFF
+                self.write = hook
+            trace.cursor = j
+            self.instruction_count += count
+        return ExecutionResult(status, count, pc)
 
     def set_cc(self, v):
         self.psr &= 0xFFF8
@@ -114,123 +546,338 @@ class LC3:
         else:
             self.psr |= 0b100
 
-    def ADD(self):
-        mode = bit_range(self.instr, 5, 1)
-        sr1 = bit_range(self.instr, 6, 3)
-        dr = bit_range(self.instr, 9, 3)
-        if not mode:
-            sr2 = bit_range(self.instr, 0, 3)
-            dr_val = self.registers[sr1] + self.registers[sr2]
-        else:
-            imm = sext_bit_range(self.instr, 0, 5)
-            dr_val = self.registers[sr1] + imm
+    def read(self, address):
+        if address >= LC3.device_base:
+            return self.read_device(address)
+        return self.memory[address]
+
+    def write(self, address, value):
+        self.dirty[address >> LC3.page_bits] = 1
+        if address >= LC3.device_base:
+            self.write_device(address, value)
+            return
+        self.memory[address] = value
+        self.decoded.pop(address, None)
+        if address in self.translator.owners:
+            self.translator.invalidate(address)
+
+    def decode(self, address):
+        instr = self.memory[address]
+        decoder = self.decoders[(instr >> 12) & 0xF]
+        if decoder is None:
+            raise IllegalOpcodeException(
+                'Illegal opcode x{:04X} at x{:04X}'.format(instr, address))
+        handler = decoder(instr)
+        if self.profiled is not None:
+            handler = self.count_jumps(address, handler)
+        if self.polling_loop(address, instr):
+            handler = partial(self.IDLE, address, handler)
+        elif instr == LC3.spin:
+            handler = partial(self.SLEEP, handler)
+        breakpoint = self.breakpoints.get(address)
+        if breakpoint is not None:
+            handler = partial(breakpoint, address, handler)
+        self.decoded[address] = handler
+        return handler
+
+    def count_jumps(self, address, handler):
+        # a profiled run counts taken branches and call targets in the
+        # handlers of the instructions that jump, not on every step
+        name = handler.func.__name__
+        if name == 'BR':
+            return partial(self.PROFILE_BR, self.profiled.jumps, address,
+                           *handler.args)
+        if name == 'JSR':
+            return partial(self.PROFILE_JSR, self.profiled.calls,
+                           *handler.args)
+        if name == 'JSRR':
+            return partial(self.PROFILE_JSRR, self.profiled.calls,
+                           *handler.args)
+        return handler
+
+    def profile_decoding(self, profile):
+        # the decode cache holds handlers for one profile, or for none
+        if self.profiled is not profile:
+            self.profiled = profile
+            self.decoded = {}
+            self.translator.reset()
+
+    def polling_loop(self, address, instr):
+        # an LDI of KBSR followed by a BRz/BRzp back onto it: the keyboard
+        # wait loop. Other status loops, like the display's, never wait and
+        # are left to run (and be translated) as they are
+        pointer = (address + 1 + sext_bit_range(instr, 0, 9)) & 0xFFFF
+        if instr >> 12 != 10 or self.memory[pointer] != LC3.kbsr:
+            return False
+        branch = self.memory[(address + 1) & 0xFFFF]
+        return branch >> 12 == 0 and branch & 0x0C00 == 0x0400 and \
+            (address + 2 + sext_bit_range(branch, 0, 9)) & 0xFFFF == address
+
+    def decode_add(self, instr):
+        dr = bit_range(instr, 9, 3)
+        sr1 = bit_range(instr, 6, 3)
+        if not bit_range(instr, 5, 1):
+            return partial(self.ADD, dr, sr1, bit_range(instr, 0, 3))
+        return partial(self.ADDI, dr, sr1, sext_bit_range(instr, 0, 5))
+
+    def decode_and(self, instr):
+        dr = bit_range(instr, 9, 3)
+        sr1 = bit_range(instr, 6, 3)
+        if not bit_range(instr, 5, 1):
+            return partial(self.AND, dr, sr1, bit_range(instr, 0, 3))
+        return partial(self.ANDI, dr, sr1, sext_bit_range(instr, 0, 5))
+
+    def decode_br(self, instr):
+        return partial(self.BR, bit_range(instr, 9, 3),
+                       sext_bit_range(instr, 0, 9))
+
+    def decode_jmp(self, instr):
+        return partial(self.JMP, bit_range(instr, 6, 3))
+
+    def decode_jsr(self, instr):
+        if not bit_range(instr, 11, 1):
+            return partial(self.JSRR, bit_range(instr, 6, 3))
+        return partial(self.JSR, sext_bit_range(instr, 0, 11))
+
+    def decode_dr_pc_offset_9(self, handler):
+        def decoder(instr):
+            return partial(handler, bit_range(instr, 9, 3),
+                           sext_bit_range(instr, 0, 9))
+        return decoder
+
+    def decode_dr_base_offset_6(self, handler):
+        def decoder(instr):
+            return partial(handler, bit_range(instr, 9, 3),
+                           bit_range(instr, 6, 3), sext_bit_range(instr, 0, 6))
+        return decoder
+
+    def decode_not(self, instr):
+        return partial(self.NOT, bit_range(instr, 9, 3),
+                       bit_range(instr, 6, 3))
+
+    def decode_rti(self, instr):
+        return partial(self.RTI)
+
+    def decode_trap(self, instr):
+        trap_vect_8 = bit_range(instr, 0, 8)
+        if self.native_traps and trap_vect_8 in self.traps:
+            return partial(self.traps[trap_vect_8])
+        return partial(self.TRAP, trap_vect_8)
+
+    def IDLE(self, address, handler):
+        # a program spinning on an empty keyboard waits here instead; the
+        # checks only run while no input is pending, and are repeated since
+        # the loop's pointer or branch may have been rewritten since decoding
+        if not self.keyboard.ready() and \
+                self.polling_loop(address, self.memory[address]):
+            self.wait_for_input()
+        handler()
+
+    def SLEEP(self, handler):
+        # BR onto itself only ends with an interrupt; with the keyboard
+        # interrupt enabled and nothing pending, wait for input instead of
+        # spinning, then take the interrupt with the branch as return address
+        if self.interrupts:
+            vector = self.pending_interrupt()
+            if vector is None and \
+                    self.memory[LC3.kbsr] & LC3.interrupt_enable and \
+                    (self.psr >> 8) & 0x7 < LC3.device_priority:
+                self.wait_for_input()
+                vector = self.pending_interrupt()
+            if vector is not None:
+                self.pc = (self.pc - 1) & 0xFFFF
+                self.interrupt(vector, LC3.device_priority)
+                return
+        handler()
+
+    def ADD(self, dr, sr1, sr2):
+        dr_val = (self.registers[sr1] + self.registers[sr2]) & 0xFFFF
         self.registers[dr] = dr_val
         self.set_cc(dr_val)
 
-    def AND(self):
-        mode = bit_range(self.instr, 5, 1)
-        sr1 = bit_range(self.instr, 6, 3)
-        dr = bit_range(self.instr, 9, 3)
-        if not mode:
-            sr2 = bit_range(self.instr, 0, 3)
-            dr_val = self.registers[sr1] & self.registers[sr2]
-        else:
-            imm = sext_bit_range(self.instr, 0, 5)
-            dr_val = self.registers[sr1] & imm
+    def ADDI(self, dr, sr1, imm):
+        dr_val = (self.registers[sr1] + imm) & 0xFFFF
+        self.registers[dr] = dr_val
+        self.set_cc(dr_val)
+
+    def AND(self, dr, sr1, sr2):
+        dr_val = self.registers[sr1] & self.registers[sr2]
+        self.registers[dr] = dr_val
+        self.set_cc(dr_val)
+
+    def ANDI(self, dr, sr1, imm):
+        dr_val = self.registers[sr1] & imm & 0xFFFF
         self.registers[dr] = dr_val
         self.set_cc(dr_val)
 
-    def BR(self):
-        if bit_range(self.instr, 9, 3) & self.psr != 0:
-            pc_offset_9 = sext_bit_range(self.instr, 0, 9)
-            self.pc += pc_offset_9
+    def BR(self, nzp, pc_offset_9):
+        if nzp & self.psr != 0:
+            self.pc = (self.pc + pc_offset_9) & 0xFFFF
 
-    def JMP(self):
-        base_r = bit_range(self.instr, 6, 3)
+    def PROFILE_BR(self, jumps, address, nzp, pc_offset_9):
+        if nzp & self.psr != 0:
+            self.pc = (self.pc + pc_offset_9) & 0xFFFF
+            jumps[address] += 1
+
+    def JMP(self, base_r):
         self.pc = self.registers[base_r]
 
-    def JSR(self):
+    def JSR(self, pc_offset_11):
         self.registers[7] = self.pc
-        mode = bit_range(self.instr, 11, 1)
-        if not mode:
-            base_r = bit_range(self.instr, 6, 3)
-            self.pc = self.registers[base_r]
-        else:
-            pc_offset_11 = sext_bit_range(self.instr, 0, 11)
-            self.pc += pc_offset_11
+        self.pc = (self.pc + pc_offset_11) & 0xFFFF
+
+    def JSRR(self, base_r):
+        target = self.registers[base_r]
+        self.registers[7] = self.pc
+        self.pc = target
+
+    def PROFILE_JSR(self, calls, pc_offset_11):
+        self.JSR(pc_offset_11)
+        calls[self.pc] += 1
 
-    def LD(self):
-        dr = bit_range(self.instr, 9, 3)
-        pc_offset_9 = sext_bit_range(self.instr, 0, 9)
-        self.registers[dr] = self.memory[self.pc + pc_offset_9]
+    def PROFILE_JSRR(self, calls, base_r):
+        self.JSRR(base_r)
+        calls[self.pc] += 1
+
+    def LD(self, dr, pc_offset_9):
+        address = (self.pc + pc_offset_9) & 0xFFFF
+        self.registers[dr] = self.read(address)
         self.set_cc(self.registers[dr])
 
-    def LDI(self):
-        dr = bit_range(self.instr, 9, 3)
-        pc_offset_9 = sext_bit_range(self.instr, 0, 9)
-        self.registers[dr] = self.memory[self.memory[self.pc + pc_offset_9]]
+    def LDI(self, dr, pc_offset_9):
+        address = self.read((self.pc + pc_offset_9) & 0xFFFF)
+        self.registers[dr] = self.read(address)
         self.set_cc(self.registers[dr])
 
-    def LDR(self):
-        dr = bit_range(self.instr, 9, 3)
-        base_r = bit_range(self.instr, 6, 3)
-        pc_offset_6 = sext_bit_range(self.instr, 0, 6)
-        self.registers[dr] = self.memory[self.registers[base_r] + pc_offset_6]
+    def LDR(self, dr, base_r, pc_offset_6):
+        address = (self.registers[base_r] + pc_offset_6) & 0xFFFF
+        self.registers[dr] = self.read(address)
         self.set_cc(self.registers[dr])
 
-    def LEA(self):
-        dr = bit_range(self.instr, 9, 3)
-        pc_offset_9 = sext_bit_range(self.instr, 0, 9)
-        self.registers[dr] = self.pc + pc_offset_9
+    def LEA(self, dr, pc_offset_9):
+        self.registers[dr] = (self.pc + pc_offset_9) & 0xFFFF
         self.set_cc(self.registers[dr])
 
-    def NOT(self):
-        dr = bit_range(self.instr, 9, 3)
-        sr = bit_range(self.instr, 6, 3)
-        self.registers[dr] = ~self.registers[sr]
+    def NOT(self, dr, sr):
+        self.registers[dr] = self.registers[sr] ^ 0xFFFF
         self.set_cc(self.registers[dr])
 
     def RTI(self):
         if bit_range(self.psr, 15, 1) == 0:
             self.pc = self.memory[self.registers[6]]
-            self.registers[6] += 1
+            self.registers[6] = (self.registers[6] + 1) & 0xFFFF
             temp = self.memory[self.registers[6]]
-            self.registers[6] += 1
+            self.registers[6] = (self.registers[6] + 1) & 0xFFFF
             self.psr = temp
+            if temp & 0x8000:
+                # back to user mode and its own stack
+                self.ssp = self.registers[6]
+                self.registers[6] = self.usp
         else:
-            raise Exception('Privilege Mode Exception')
+            raise PrivilegeModeException(
+                'RTI executed in user mode at x{:04X}'.format(
+                    (self.pc - 1) & 0xFFFF))
 
-    def ST(self):
-        sr = bit_range(self.instr, 9, 3)
-        pc_offset_9 = sext_bit_range(self.instr, 0, 9)
-        self.memory[self.pc + pc_offset_9] = self.registers[sr]
+    def ST(self, sr, pc_offset_9):
+        address = (self.pc + pc_offset_9) & 0xFFFF
+        self.write(address, self.registers[sr])
 
-    def STI(self):
-        sr = bit_range(self.instr, 9, 3)
-        pc_offset_9 = sext_bit_range(self.instr, 0, 9)
-        self.memory[self.memory[self.pc + pc_offset_9]] = self.registers[sr]
+    def STI(self, sr, pc_offset_9):
+        address = self.read((self.pc + pc_offset_9) & 0xFFFF)
+        self.write(address, self.registers[sr])
 
-    def STR(self):
-        sr = bit_range(self.instr, 9, 3)
-        base_r = bit_range(self.instr, 6, 3)
-        pc_offset_6 = sext_bit_range(self.instr, 0, 6)
-        self.memory[self.registers[base_r] + pc_offset_6] = self.registers[sr]
+    def STR(self, sr, base_r, pc_offset_6):
+        address = (self.registers[base_r] + pc_offset_6) & 0xFFFF
+        self.write(address, self.registers[sr])
 
-    def TRAP(self):
+    def TRAP(self, trap_vect_8):
         self.registers[7] = self.pc
-        trap_vect_8 = bit_range(self.instr, 0, 8)
         self.pc = self.memory[trap_vect_8]
 
+    def wait_for_input(self):
+        # called from a handler, so on failure pc is moved back onto the
+        # instruction and it is retried when the machine resumes
+        self.display.flush()
+        keyboard = self.keyboard
+        timeout = None
+        if self.deadline is not None:
+            timeout = self.deadline - monotonic()
+        # checked under the lock the reader feeds through, so a last line
+        # put just before the reader finished isn't taken for no input
+        with keyboard.condition:
+            if keyboard.ready():
+                return
+            if self.blocking_input and keyboard.listening() and \
+                    keyboard.wait(timeout):
+                return
+            self.pc = (self.pc - 1) & 0xFFFF
+            if self.blocking_input and keyboard.listening():
+                raise InputTimeoutException(
+                    'No input before the deadline at x{:04X}'.format(self.pc))
+            raise InputWaitException(
+                'Waiting for input at x{:04X}'.format(self.pc))
+
+    def getc(self):
+        if not self.keyboard.ready():
+            self.wait_for_input()
+        self.registers[0] = self.keyboard.read_data()
+
+    def string(self, address):
+        try:
+            end = self.memory.index(0, address)
+        except ValueError:
+            end = LC3.mem_size
+        return self.memory[address:end]
+
+    def GETC(self):
+        self.registers[7] = self.pc
+        self.getc()
+
+    def OUT(self):
+        self.registers[7] = self.pc
+        self.display.write_data(self.registers[0])
+
+    def PUTS(self):
+        self.registers[7] = self.pc
+        self.display.write_text(
+            ''.join(map(chr, self.string(self.registers[0]))))
+
+    def IN(self):
+        self.registers[7] = self.pc
+        if not self.prompted:
+            self.display.write_text(LC3.in_prompt)
+            self.prompted = True
+        self.getc()
+        self.prompted = False
+
+    def PUTSP(self):
+        self.registers[7] = self.pc
+        chars = []
+        for word in self.string(self.registers[0]):
+            chars.append(chr(word & 0xFF))
+            if word >> 8 == 0:
+                break
+            chars.append(chr(word >> 8))
+        self.display.write_text(''.join(chars))
+
+    def HALT(self):
+        self.registers[7] = self.pc
+        self.write(LC3.mcr, 0)
+
 
 def bit_range(num, start, bits):
     return (num >> start) & ~(~0 << bits)
 
 
 def sext_bit_range(num, start, bits):
-    if (num >> start) & 0x1 << (bits - 1) == 0:
-        return (num >> start) & ~(~0 << (bits - 1))
-    else:
-        return -(-(num >> start) & ~(~0 << (bits - 1)))
+    sign = 1 << (bits - 1)
+    return (((num >> start) & ~(~0 << bits)) ^ sign) - sign
+
+
+def to_words(memory):
+    if isinstance(memory, array) and memory.typecode == 'H':
+        return memory
+    return array('H', [word & LC3.word_mask for word in memory])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,217 @@
+import argparse
+import hashlib
+import os
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from assembler import Assembler, AssemblerException
+from objfile import read_module, write_module, write_object
+
+
+class LinkerException(Exception):
+    pass
+
+
+class Module:
+    def __init__(self, name, segments, labels, exports, relocations):
+        self.name = name
+        self.segments = segments
+        self.labels = labels
+        self.exports = exports
+        self.relocations = relocations
+
+    def imports(self):
+        return sorted({label for _, label, _ in self.relocations
+                       if label not in self.labels})
+
+    def write(self, filename):
+        write_module(filename, self.segments, self.labels, self.exports,
+                     self.relocations)
+
+    @staticmethod
+    def read(filename, name=None):
+        return Module(name or filename, *read_module(filename))
+
+
+def assemble_module(filename):
+    # labels that aren't defined in the module are left as fixups and become
+    # its imports, resolved against the other modules' exports when linking
+    assembler = Assembler()
+    memory = array('H', [0]) * (1 << 16)
+    try:
+        with open(filename, 'r') as f:
+            assembler.assemble_lines(f, memory)
+        assembler.backpatch(memory, strict=False)
+    except AssemblerException as e:
+        raise AssemblerException('{}: {}'.format(filename, e))
+    for name in assembler.exports:
+        if name not in assembler.labels:
+            raise AssemblerException('{}: Exported label {} is not '
+                                     'defined'.format(filename, name))
+    segments = [(start, memory[start:end])
+                for start, end in assembler.segments if end > start]
+    return Module(filename, segments, assembler.labels, assembler.exports,
+                  assembler.relocations)
+
+
+def module_path(filename, build_dir):
+    # sources with the same name in different directories get their own
+    # modules
+    digest = hashlib.sha256(
+        os.path.abspath(filename).encode('utf-8')).hexdigest()[:12]
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(build_dir, '{}-{}.lo'.format(name, digest))
+
+
+def build_module(filename, build_dir=None):
+    if build_dir is None:
+        return assemble_module(filename)
+    path = module_path(filename, build_dir)
+    if os.path.exists(path) and \
+            os.path.getmtime(path) >= os.path.getmtime(filename):
+        return Module.read(path, filename)
+    module = assemble_module(filename)
+    os.makedirs(build_dir, exist_ok=True)
+    module.write(path)
+    return module
+
+
+def build(filenames, build_dir=None, workers=None):
+    if workers == 1 or len(filenames) < 2:
+        return [build_module(filename, build_dir) for filename in filenames]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(build_module, filenames,
+                             [build_dir] * len(filenames)))
+
+
+class Linker:
+    def __init__(self):
+        self.memory = None
+        self.segments = []
+        self.symbols = {}
+
+    def link(self, modules, placements=None):
+        # a module given a placement is moved so that its first segment
+        # starts there; its other segments move by the same amount
+        placements = placements or {}
+        memory = array('H', [0]) * (1 << 16)
+        deltas = {}
+        placed = []
+        for module in modules:
+            delta = 0
+            if module.name in placements and module.segments:
+                delta = placements[module.name] - module.segments[0][0]
+            deltas[module.name] = delta
+            for start, words in module.segments:
+                start += delta
+                if start < 0 or start + len(words) > len(memory):
+                    raise LinkerException(
+                        '{}: Segment x{:04X} does not fit in memory'.format(
+                            module.name, start & 0xFFFF))
+                placed.append((start, start + len(words), module.name))
+                memory[start:start + len(words)] = words
+        self.check_overlaps(placed)
+
+        symbols = {}
+        owners = {}
+        for module in modules:
+            for name in module.exports:
+                if name in symbols:
+                    raise LinkerException(
+                        'Symbol {} is exported by both {} and {}'.format(
+                            name, owners[name], module.name))
+                symbols[name] = module.labels[name] + deltas[module.name]
+                owners[name] = module.name
+
+        for module in modules:
+            missing = [name for name in module.imports()
+                       if name not in symbols]
+            if missing:
+                raise LinkerException('{}: Undefined symbols: {}'.format(
+                    module.name, ', '.join(missing)))
+        for module in modules:
+            self.relocate(module, deltas[module.name], symbols, memory)
+
+        self.memory = memory
+        self.segments = [(start, end) for start, end, _ in sorted(placed)]
+        self.symbols = symbols
+        return memory
+
+    @staticmethod
+    def check_overlaps(placed):
+        placed = sorted(placed)
+        for (start, end, name), (next_start, next_end, next_name) in \
+                zip(placed, placed[1:]):
+            if next_start < end:
+                raise LinkerException(
+                    '{} x{:04X}-x{:04X} overlaps {} x{:04X}-x{:04X}'.format(
+                        name, start, end - 1, next_name, next_start,
+                        next_end - 1))
+
+    @staticmethod
+    def relocate(module, delta, symbols, memory):
+        for address, label, bits in module.relocations:
+            address += delta
+            if label in module.labels:
+                target = module.labels[label] + delta
+            else:
+                target = symbols[label]
+            if bits == 16:
+                memory[address] = target
+                continue
+            offset = target - (address + 1)
+            if not -(1 << (bits - 1)) <= offset < 1 << (bits - 1):
+                raise LinkerException(
+                    '{}: Symbol {} is out of range of a {} bit offset at '
+                    'x{:04X}'.format(module.name, label, bits, address))
+            mask = ~(~0 << bits)
+            memory[address] = memory[address] & ~mask | offset & mask
+
+    def write_object(self, filename):
+        write_object(filename, self.memory, self.segments, self.symbols)
+
+
+def link_files(filenames, build_dir=None, workers=None, placements=None):
+    linker = Linker()
+    linker.link(build(filenames, build_dir, workers), placements)
+    return linker
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Assemble LC-3 modules separately and link them into '
+                    'one image.')
+    parser.add_argument('files', nargs='+', help='.asm sources or .lo modules')
+    parser.add_argument('-o', '--output', required=True,
+                        help='object file to write the linked image to')
+    parser.add_argument('--build-dir', default=None,
+                        help='keep assembled modules here and only '
+                             'reassemble sources that changed')
+    parser.add_argument('--place', action='append', default=[],
+                        metavar='FILE=ADDRESS',
+                        help='move a module so it starts at ADDRESS')
+    parser.add_argument('-j', '--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    placements = {}
+    for place in args.place:
+        name, address = place.split('=', 1)
+        placements[name] = int(address.lstrip('xX'), 16)
+    sources = [name for name in args.files if not name.endswith('.lo')]
+    modules = {module.name: module
+               for module in build(sources, args.build_dir, args.workers)}
+    modules.update((name, Module.read(name))
+                   for name in args.files if name.endswith('.lo'))
+    linker = Linker()
+    try:
+        linker.link([modules[name] for name in args.files], placements)
+    except LinkerException as e:
+        sys.stderr.write(str(e) + '\n')
+        return 1
+    linker.write_object(args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
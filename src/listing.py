@@ -0,0 +1,245 @@
+import argparse
+import sys
+
+import numpy as np
+
+from assembler import Assembler
+from objfile import read_object
+
+trap_names = {0x20: 'GETC', 0x21: 'OUT', 0x22: 'PUTS', 0x23: 'IN',
+              0x24: 'PUTSP', 0x25: 'HALT'}
+memory_ops = {2: 'LD', 3: 'ST', 10: 'LDI', 11: 'STI', 14: 'LEA'}
+escapes = {'\\': '\\\\', '"': '\\"', '\n': '\\n', '\t': '\\t', '\r': '\\r'}
+
+
+def sext(words, bits):
+    sign = 1 << (bits - 1)
+    return ((words & ((1 << bits) - 1)) ^ sign) - sign
+
+
+class ImageDisassembler:
+    max_gap = 8
+    min_string = 2
+
+    def __init__(self, memory, symbols=None):
+        self.words = np.zeros(1 << 16, dtype=np.int32)
+        self.words[:len(memory)] = np.asarray(memory, dtype=np.uint16)
+        self.symbols = symbols or {}
+        self.decode()
+
+    def decode(self):
+        # validity and branch targets of every word are computed up front so
+        # the control flow walk only indexes into plain sequences
+        w = self.words
+        addresses = np.arange(1 << 16, dtype=np.int32)
+        opcode = w >> 12
+        dr = (w >> 9) & 0x7
+        register_mode = ((opcode == 1) | (opcode == 5)) & (w & 0x20 == 0)
+        jsrr = (opcode == 4) & (w & 0x0800 == 0)
+
+        # words whose don't-care bits are set can't be reproduced by the
+        # assembler and are listed as data instead
+        valid = (opcode != 13) & ~((opcode == 0) & (dr == 0))
+        valid &= ~(register_mode & (w & 0x18 != 0))
+        valid &= ~(jsrr & (w & 0x063F != 0))
+        valid &= ~((opcode == 8) & (w & 0x0FFF != 0))
+        valid &= ~((opcode == 9) & (w & 0x3F != 0x3F))
+        valid &= ~((opcode == 12) & (w & 0x0E3F != 0))
+        valid &= ~((opcode == 15) & (w & 0x0F00 != 0))
+
+        printable = ((w >= 0x20) & (w < 0x7F)) | (w == 0x9) | (w == 0xA) | \
+            (w == 0xD)
+
+        offsets = np.where(opcode == 4, sext(w, 11), sext(w, 9))
+        targets = addresses + 1 + offsets
+        # the assembler doesn't wrap PC offsets around memory, so neither
+        # can a word whose target only lies past either end
+        pc_relative = (opcode == 0) | np.isin(opcode, list(memory_ops)) | \
+            (opcode == 4) & (w & 0x0800 != 0)
+        valid &= ~(pc_relative & ((targets < 0) | (targets > 0xFFFF)))
+        self.targets = (targets & 0xFFFF).tolist()
+        self.valid = valid.astype(np.uint8).tobytes()
+        self.printable = printable.astype(np.uint8).tobytes()
+        self.values = w.tolist()
+
+    def vectors(self):
+        return [vector for vector in range(0x20, 0x200)
+                if self.values[vector] and self.values[self.values[vector]]]
+
+    def trace(self, entries):
+        code = bytearray(1 << 16)
+        work = list(entries)
+        targets = self.targets
+        valid = self.valid
+        values = self.values
+        while work:
+            address = work.pop()
+            while not code[address] and valid[address]:
+                code[address] = 1
+                value = values[address]
+                op = value >> 12
+                if op == 0:
+                    work.append(targets[address])
+                    if value & 0x0E00 == 0x0E00:
+                        break
+                elif op == 4:
+                    if value & 0x0800:
+                        work.append(targets[address])
+                elif op == 8 or op == 12:
+                    break
+                elif op == 15 and value & 0xFF == 0x25:
+                    break
+                address = (address + 1) & 0xFFFF
+        return code
+
+    def label_targets(self, code, vectors):
+        names = {address: name for name, address in self.symbols.items()}
+        labels = {}
+        for vector in vectors:
+            target = self.values[vector]
+            if code[target]:
+                prefix = 'TRAP' if vector < 0x100 else 'INT'
+                labels[target] = '{}_{:02X}'.format(prefix, vector & 0xFF)
+        prefixes = {0: 'L', 4: 'SUB'}
+        prefixes.update((op, 'D') for op in memory_ops)
+        for address in np.flatnonzero(np.frombuffer(code, dtype=np.uint8)):
+            value = self.values[address]
+            prefix = prefixes.get(value >> 12)
+            if prefix and (value >> 12 != 4 or value & 0x0800):
+                target = self.targets[address]
+                labels.setdefault(target, '{}_{:04X}'.format(prefix, target))
+        labels.update(names)
+        return labels
+
+    def segments(self, code, labels):
+        used = (self.words != 0) | \
+            np.frombuffer(code, dtype=np.uint8).astype(bool)
+        used[list(labels)] = True
+        addresses = np.flatnonzero(used)
+        if not addresses.size:
+            return []
+        breaks = np.flatnonzero(np.diff(addresses) > self.max_gap + 1)
+        starts = [addresses[0]] + list(addresses[breaks + 1])
+        ends = list(addresses[breaks] + 1) + [addresses[-1] + 1]
+        return [(int(start), int(end)) for start, end in zip(starts, ends)]
+
+    def disassemble(self, entries=None):
+        vectors = self.vectors()
+        if entries is None:
+            entries = [0x3000]
+        entries = list(entries) + [self.values[v] for v in vectors]
+        code = self.trace(entries)
+        labels = self.label_targets(code, vectors)
+        lines = []
+        for start, end in self.segments(code, labels):
+            lines.append('.ORIG x{:04X}'.format(start))
+            lines.extend(self.segment(start, end, code, labels))
+            lines.append('.END')
+            lines.append('')
+        return lines
+
+    def segment(self, start, end, code, labels):
+        values = self.values
+        address = start
+        while address < end:
+            label = labels.get(address, '')
+            value = values[address]
+            following = address + 1
+            if code[address]:
+                text = self.instruction(address, labels)
+            elif address < 0x200 and labels.get(value) and code[value]:
+                text = '.FILL ' + labels[value]
+            elif value == 0:
+                while following < end and not values[following] and \
+                        following not in labels and not code[following]:
+                    following += 1
+                if following - address == 1:
+                    text = '.FILL x0000'
+                else:
+                    text = '.BLKW {}'.format(following - address)
+            else:
+                following = self.string_end(address, code, labels)
+                if following:
+                    text = '.STRINGZ "{}"'.format(''.join(
+                        escapes.get(chr(char), chr(char))
+                        for char in values[address:following - 1]))
+                else:
+                    following = address + 1
+                    text = '.FILL x{:04X}'.format(value)
+            yield '{:<11} {}'.format(label, text).rstrip()
+            address = following
+
+    def string_end(self, address, code, labels):
+        values = self.values
+        current = address
+        while current < len(values) and self.printable[current] and \
+                not code[current] and \
+                (current == address or current not in labels):
+            current += 1
+        # the terminator may be the word just past the segment, which is
+        # zero by construction
+        if current - address < self.min_string or \
+                current >= len(values) or values[current] or \
+                code[current] or current in labels:
+            return None
+        return current + 1
+
+    def instruction(self, address, labels):
+        value = self.values[address]
+        op = value >> 12
+        dr = (value >> 9) & 0x7
+        sr1 = (value >> 6) & 0x7
+        if op == 1 or op == 5:
+            name = 'ADD' if op == 1 else 'AND'
+            if value & 0x20:
+                return '{} R{}, R{}, #{}'.format(name, dr, sr1,
+                                                 sext(value, 5))
+            return '{} R{}, R{}, R{}'.format(name, dr, sr1, value & 0x7)
+        if op == 0:
+            return 'BR{}{}{} {}'.format(
+                'n' if value & 0x0800 else '', 'z' if value & 0x0400 else '',
+                'p' if value & 0x0200 else '', labels[self.targets[address]])
+        if op in memory_ops:
+            return '{} R{}, {}'.format(memory_ops[op], dr,
+                                       labels[self.targets[address]])
+        if op == 4:
+            if value & 0x0800:
+                return 'JSR ' + labels[self.targets[address]]
+            return 'JSRR R{}'.format(sr1)
+        if op == 6 or op == 7:
+            return '{} R{}, R{}, #{}'.format('LDR' if op == 6 else 'STR', dr,
+                                             sr1, sext(value, 6))
+        if op == 8:
+            return 'RTI'
+        if op == 9:
+            return 'NOT R{}, R{}'.format(dr, sr1)
+        if op == 12:
+            return 'RET' if sr1 == 7 else 'JMP R{}'.format(sr1)
+        vector = value & 0xFF
+        return trap_names.get(vector) or 'TRAP x{:02X}'.format(vector)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Disassemble a whole LC-3 memory image into source.')
+    parser.add_argument('file', help='an object file, or .asm source')
+    parser.add_argument('--entry', action='append', default=None,
+                        help='address where execution starts (default '
+                             'x3000); may be repeated')
+    args = parser.parse_args(argv)
+
+    if args.file.endswith('.asm'):
+        assembler = Assembler()
+        memory = assembler.assemble_file(args.file)
+        symbols = assembler.labels
+    else:
+        memory, _, symbols = read_object(args.file)
+    entries = None
+    if args.entry:
+        entries = [int(entry.lstrip('xX'), 16) for entry in args.entry]
+    lines = ImageDisassembler(memory, symbols).disassemble(entries)
+    sys.stdout.write('\n'.join(lines))
+
+
+if __name__ == '__main__':
+    main()
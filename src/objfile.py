@@ -0,0 +1,210 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+magic = b'LC3O'
+module_magic = b'LC3M'
+version = 1
+header = struct.Struct('>4sHH')
+segment_header = struct.Struct('>HI')
+symbol_header = struct.Struct('>HH')
+count_header = struct.Struct('>I')
+relocation_header = struct.Struct('>HBH')
+chunk_words = 1 << 12
+
+
+def to_big_endian(words):
+    words = array('H', words)
+    if sys.byteorder == 'little':
+        words.byteswap()
+    return words.tobytes()
+
+
+def from_big_endian(data):
+    words = array('H')
+    words.frombytes(data)
+    if sys.byteorder == 'little':
+        words.byteswap()
+    return words
+
+
+def write_symbols(f, symbols):
+    f.write(count_header.pack(len(symbols)))
+    for name, address in sorted(symbols.items(), key=lambda s: s[1]):
+        encoded = name.encode('utf-8')
+        f.write(symbol_header.pack(address & 0xFFFF, len(encoded)))
+        f.write(encoded)
+
+
+def read_symbols(data, offset):
+    symbols = {}
+    count, = count_header.unpack_from(data, offset)
+    offset += count_header.size
+    for _ in range(count):
+        address, length = symbol_header.unpack_from(data, offset)
+        offset += symbol_header.size
+        symbols[data[offset:offset + length].decode('utf-8')] = address
+        offset += length
+    return symbols, offset
+
+
+def write_object(filename, memory, segments, symbols=None):
+    symbols = symbols or {}
+    tmp = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(header.pack(magic, version, len(segments)))
+        for start, end in segments:
+            f.write(segment_header.pack(start, end - start))
+            f.write(to_big_endian(memory[start:end]))
+        write_symbols(f, symbols)
+    os.replace(tmp, filename)
+
+
+def read_object(filename, memory=None):
+    with open(filename, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return parse_object(data, memory, filename)
+
+
+def parse_object(data, memory=None, name='<bytes>'):
+    if memory is None:
+        memory = array('H', [0]) * (1 << 16)
+    segments = []
+    file_magic, file_version, count = header.unpack_from(data, 0)
+    if file_magic != magic or file_version != version:
+        raise Exception('Not an LC-3 object file: ' + name)
+    offset = header.size
+    for _ in range(count):
+        start, length = segment_header.unpack_from(data, offset)
+        offset += segment_header.size
+        end = offset + 2 * length
+        if start + length > len(memory):
+            raise Exception('Segment x{:04X} overflows memory'.format(start))
+        memory[start:start + length] = from_big_endian(data[offset:end])
+        segments.append((start, start + length))
+        offset = end
+    symbols, _ = read_symbols(data, offset)
+    return memory, segments, symbols
+
+
+def write_records(filename, records, symbols=None):
+    # (address, word) records are written as they arrive; a segment ends
+    # wherever an address doesn't follow the previous one, and its length is
+    # filled in once it does. symbols is only read after the last record, so
+    # it may still be growing while records are produced
+    tmp = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(header.pack(magic, version, 0))
+        count = 0
+        position = start = expected = None
+        chunk = array('H')
+        for address, word in records:
+            if address != expected or len(chunk) >= chunk_words:
+                f.write(to_big_endian(chunk))
+                del chunk[:]
+            if address != expected:
+                if position is not None:
+                    end_segment(f, position, start, expected)
+                position = f.tell()
+                f.write(segment_header.pack(address, 0))
+                start = address
+                count += 1
+            chunk.append(word)
+            expected = address + 1
+        f.write(to_big_endian(chunk))
+        if position is not None:
+            end_segment(f, position, start, expected)
+        write_symbols(f, symbols or {})
+        f.seek(0)
+        f.write(header.pack(magic, version, count))
+    os.replace(tmp, filename)
+
+
+def end_segment(f, position, start, end):
+    current = f.tell()
+    f.seek(position)
+    f.write(segment_header.pack(start, end - start))
+    f.seek(current)
+
+
+def iter_object(filename):
+    # (address, word) records of an object file, read through a memory map
+    # a chunk at a time
+    with open(filename, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        file_magic, file_version, count = header.unpack_from(data, 0)
+        if file_magic != magic or file_version != version:
+            raise Exception('Not an LC-3 object file: ' + filename)
+        offset = header.size
+        for _ in range(count):
+            start, length = segment_header.unpack_from(data, offset)
+            offset += segment_header.size
+            yield from iter_words(data, offset, length, start)
+            offset += 2 * length
+
+
+def iter_image(filename, origin=0):
+    # a raw image of big-endian words loaded at origin
+    with open(filename, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        yield from iter_words(data, 0, len(data) // 2, origin)
+
+
+def iter_words(data, offset, length, address):
+    for first in range(0, length, chunk_words):
+        size = min(chunk_words, length - first)
+        start = offset + 2 * first
+        words = from_big_endian(data[start:start + 2 * size])
+        yield from zip(range(address + first, address + first + size),
+                       words)
+
+
+def write_module(filename, segments, labels, exports, relocations):
+    # a relocatable module keeps its segments as separate word arrays, every
+    # label, the exported names and each symbolic reference to patch at
+    # link time
+    tmp = '{}.{}.tmp'.format(filename, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(header.pack(module_magic, version, len(segments)))
+        for start, words in segments:
+            f.write(segment_header.pack(start, len(words)))
+            f.write(to_big_endian(words))
+        write_symbols(f, labels)
+        write_symbols(f, {name: labels[name] for name in exports})
+        f.write(count_header.pack(len(relocations)))
+        for address, label, bits in relocations:
+            encoded = label.encode('utf-8')
+            f.write(relocation_header.pack(address, bits, len(encoded)))
+            f.write(encoded)
+    os.replace(tmp, filename)
+
+
+def read_module(filename):
+    segments = []
+    relocations = []
+    with open(filename, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        file_magic, file_version, count = header.unpack_from(data, 0)
+        if file_magic != module_magic or file_version != version:
+            raise Exception('Not an LC-3 module: ' + filename)
+        offset = header.size
+        for _ in range(count):
+            start, length = segment_header.unpack_from(data, offset)
+            offset += segment_header.size
+            end = offset + 2 * length
+            segments.append((start, from_big_endian(data[offset:end])))
+            offset = end
+        labels, offset = read_symbols(data, offset)
+        exports, offset = read_symbols(data, offset)
+        count, = count_header.unpack_from(data, offset)
+        offset += count_header.size
+        for _ in range(count):
+            address, bits, length = relocation_header.unpack_from(data,
+                                                                  offset)
+            offset += relocation_header.size
+            relocations.append(
+                (address, data[offset:offset + length].decode('utf-8'), bits))
+            offset += length
+    return segments, labels, list(exports), relocations
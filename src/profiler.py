@@ -0,0 +1,122 @@
+from disassembler import Disassembler
+
+opcode_names = ['BR', 'ADD', 'LD', 'ST', 'JSR', 'AND', 'LDR', 'STR', 'RTI',
+                'NOT', 'LDI', 'STI', 'JMP', 'Reserved', 'LEA', 'TRAP']
+
+
+def counters():
+    # a list rather than an array: the profiled loop bumps a counter on
+    # every step, and list items are cheaper to update
+    return [0] * (1 << 16)
+
+
+class Profile:
+    def __init__(self):
+        self.counts = counters()
+        self.jumps = counters()
+        self.calls = counters()
+        self.memory = None
+        self.disassembler = Disassembler()
+
+    def executed(self):
+        return [address for address, count in enumerate(self.counts)
+                if count]
+
+    def opcodes(self):
+        histogram = {}
+        for address in self.executed():
+            name = opcode_names[self.memory[address] >> 12]
+            histogram[name] = histogram.get(name, 0) + self.counts[address]
+        return histogram
+
+    def branches(self):
+        return [(address, self.jumps[address],
+                 self.counts[address] - self.jumps[address])
+                for address in self.executed()
+                if self.memory[address] >> 12 == 0]
+
+    def subroutines(self):
+        return {address: count for address, count in enumerate(self.calls)
+                if count}
+
+    def traps(self):
+        histogram = {}
+        for address in self.executed():
+            instr = self.memory[address]
+            if instr >> 12 == 15:
+                vector = instr & 0xFF
+                histogram[vector] = histogram.get(vector, 0) + \
+                    self.counts[address]
+        return histogram
+
+    def loops(self):
+        # a taken branch back to an earlier address closes a loop whose body
+        # is everything between the target and the branch
+        found = []
+        for address, taken, _ in self.branches():
+            offset = self.memory[address] & 0x1FF
+            target = (address + 1 + offset - (offset & 0x100) * 2) & 0xFFFF
+            if taken and target <= address:
+                found.append((target, address, taken,
+                              sum(self.counts[target:address + 1])))
+        return sorted(found, key=lambda loop: -loop[3])
+
+    def report(self, labels=None, limit=20):
+        symbols = Symbols(labels or {})
+        total = sum(self.counts)
+        lines = ['{} instructions executed'.format(total), '',
+                 'Hot instructions:']
+        hot = sorted(self.executed(), key=lambda a: -self.counts[a])[:limit]
+        for address in hot:
+            lines.append('  x{:04X} {:<20} {:>12} {:6.2f}%  {}'.format(
+                address, symbols.name(address), self.counts[address],
+                100.0 * self.counts[address] / total,
+                self.disassembler.disassemble_line(self.memory[address])))
+
+        lines += ['', 'Opcode mix:']
+        for name, count in sorted(self.opcodes().items(),
+                                  key=lambda op: -op[1]):
+            lines.append('  {:<8} {:>12} {:6.2f}%'.format(
+                name, count, 100.0 * count / total))
+
+        lines += ['', 'Branches (taken / not taken):']
+        for address, taken, not_taken in self.branches()[:limit]:
+            lines.append('  x{:04X} {:<20} {:>12} {:>12}  {}'.format(
+                address, symbols.name(address), taken, not_taken,
+                self.disassembler.disassemble_line(self.memory[address])))
+
+        lines += ['', 'Hot loops:']
+        for start, end, iterations, executed in self.loops()[:limit]:
+            lines.append('  x{:04X}-x{:04X} {:<20} {:>12} iterations '
+                         '{:>12} instructions'.format(
+                             start, end, symbols.name(start), iterations,
+                             executed))
+
+        lines += ['', 'Calls:']
+        for address, count in sorted(self.subroutines().items(),
+                                     key=lambda call: -call[1])[:limit]:
+            lines.append('  x{:04X} {:<20} {:>12}'.format(
+                address, symbols.name(address), count))
+        for vector, count in sorted(self.traps().items()):
+            lines.append('  TRAP x{:02X} {:<15} {:>12}'.format(
+                vector, symbols.name(self.memory[vector]), count))
+        return '\n'.join(lines)
+
+
+class Symbols:
+    def __init__(self, labels):
+        self.addresses = sorted((address, name)
+                                for name, address in labels.items())
+        self.names = {address: name for address, name in self.addresses}
+
+    def name(self, address):
+        if address in self.names:
+            return self.names[address]
+        preceding = None
+        for start, name in self.addresses:
+            if start > address:
+                break
+            preceding = (start, name)
+        if preceding is None:
+            return ''
+        return '{}+{}'.format(preceding[1], address - preceding[0])
@@ -0,0 +1,207 @@
+import io
+import sys
+
+import numpy as np
+
+from devices import Display, Keyboard
+from lc3 import LC3, ExecutionResult
+
+running = 0
+statuses = [None, ExecutionResult.halted, ExecutionResult.budget,
+            ExecutionResult.illegal_opcode,
+            ExecutionResult.privilege_violation]
+halted, budget, illegal_opcode, privilege_violation = range(1, 5)
+
+
+def sext(values, bits):
+    sign = 1 << (bits - 1)
+    values = (values.astype(np.int32) & ((1 << bits) - 1) ^ sign) - sign
+    return (values & 0xFFFF).astype(np.uint16)
+
+
+class Lane:
+    def __init__(self, memory):
+        self.memory = memory
+        self.keyboard = Keyboard()
+        self.output = io.StringIO()
+        self.display = Display(self.output)
+        self.interrupts = False
+        self.end_slice = False
+
+    def update_interrupts(self):
+        # lanes don't take interrupts; the enable bits are only stored
+        pass
+
+
+class VectorLC3:
+    def __init__(self, count):
+        self.count = count
+        self.memory = np.zeros((count, LC3.mem_size), dtype=np.uint16)
+        self.registers = np.zeros((count, LC3.num_registers), dtype=np.uint16)
+        self.pc = np.zeros(count, dtype=np.uint16)
+        self.psr = np.zeros(count, dtype=np.uint16)
+        self.status = np.zeros(count, dtype=np.int8)
+        self.instructions = np.zeros(count, dtype=np.int64)
+        self.lanes = [Lane(self.memory[i]) for i in range(count)]
+        self.handlers = [
+            self.BR, self.ADD, self.LD, self.ST, self.JSR, self.AND,
+            self.LDR, self.STR, self.RTI, self.NOT, self.LDI,
+            self.STI, self.JMP, self.reserved, self.LEA, self.TRAP
+        ]
+
+    def load(self, memory, origin=0x3000):
+        self.memory[:] = np.frombuffer(memory, dtype=np.uint16)
+        for lane in self.lanes:
+            LC3.reset_device_registers(lane)
+        self.pc[:] = origin
+        self.psr[:] = LC3.initial_psr
+        self.status[:] = running
+        self.instructions[:] = 0
+
+    def run(self, max_instructions=None):
+        limit = sys.maxsize if max_instructions is None else max_instructions
+        while True:
+            lanes = np.flatnonzero(self.status == running)
+            exhausted = self.instructions[lanes] >= limit
+            if exhausted.any():
+                self.status[lanes[exhausted]] = budget
+                lanes = lanes[~exhausted]
+            if lanes.size == 0:
+                break
+            self.step(lanes)
+        for lane in self.lanes:
+            lane.display.flush()
+        return self.results()
+
+    def step(self, lanes):
+        pcs = self.pc[lanes]
+        instrs = self.memory[lanes, pcs]
+        self.pc[lanes] = pcs + 1
+        self.instructions[lanes] += 1
+        opcodes = instrs >> 12
+        for opcode in np.unique(opcodes):
+            group = opcodes == opcode
+            self.handlers[opcode](lanes[group], instrs[group])
+        stopped = self.memory[lanes, LC3.mcr] == 0
+        self.status[lanes[stopped & (self.status[lanes] == running)]] = halted
+
+    def results(self):
+        return [ExecutionResult(statuses[self.status[i]] or 'running',
+                                int(self.instructions[i]), int(self.pc[i]))
+                for i in range(self.count)]
+
+    def outputs(self):
+        return [lane.output.getvalue() for lane in self.lanes]
+
+    def fault(self, lanes, status):
+        self.pc[lanes] -= 1
+        self.instructions[lanes] -= 1
+        self.status[lanes] = status
+
+    def set_cc(self, lanes, values):
+        cc = np.where(values == 0, 0b010,
+                      np.where(values & 0x8000, 0b100, 0b001))
+        self.psr[lanes] = self.psr[lanes] & 0xFFF8 | cc.astype(np.uint16)
+
+    def read(self, lanes, addresses):
+        values = self.memory[lanes, addresses]
+        for k in np.flatnonzero(addresses >= LC3.device_base):
+            values[k] = LC3.read_device(self.lanes[lanes[k]],
+                                        int(addresses[k]))
+        return values
+
+    def write(self, lanes, addresses, values):
+        devices = addresses >= LC3.device_base
+        if not devices.any():
+            self.memory[lanes, addresses] = values
+            return
+        normal = ~devices
+        self.memory[lanes[normal], addresses[normal]] = values[normal]
+        for k in np.flatnonzero(devices):
+            LC3.write_device(self.lanes[lanes[k]], int(addresses[k]),
+                             int(values[k]))
+
+    def reserved(self, lanes, instrs):
+        self.fault(lanes, illegal_opcode)
+
+    def ADD(self, lanes, instrs):
+        sr1 = self.registers[lanes, instrs >> 6 & 0x7]
+        sr2 = self.registers[lanes, instrs & 0x7]
+        operand = np.where(instrs & 0x20, sext(instrs, 5), sr2)
+        self.registers[lanes, instrs >> 9 & 0x7] = sr1 + operand
+        self.set_cc(lanes, sr1 + operand)
+
+    def AND(self, lanes, instrs):
+        sr1 = self.registers[lanes, instrs >> 6 & 0x7]
+        sr2 = self.registers[lanes, instrs & 0x7]
+        operand = np.where(instrs & 0x20, sext(instrs, 5), sr2)
+        self.registers[lanes, instrs >> 9 & 0x7] = sr1 & operand
+        self.set_cc(lanes, sr1 & operand)
+
+    def BR(self, lanes, instrs):
+        taken = (instrs >> 9 & 0x7 & self.psr[lanes]) != 0
+        pcs = self.pc[lanes]
+        self.pc[lanes] = np.where(taken, pcs + sext(instrs, 9), pcs)
+
+    def JMP(self, lanes, instrs):
+        self.pc[lanes] = self.registers[lanes, instrs >> 6 & 0x7]
+
+    def JSR(self, lanes, instrs):
+        pcs = self.pc[lanes]
+        targets = np.where(instrs & 0x0800, pcs + sext(instrs, 11),
+                           self.registers[lanes, instrs >> 6 & 0x7])
+        self.registers[lanes, 7] = pcs
+        self.pc[lanes] = targets
+
+    def LD(self, lanes, instrs):
+        values = self.read(lanes, self.pc[lanes] + sext(instrs, 9))
+        self.registers[lanes, instrs >> 9 & 0x7] = values
+        self.set_cc(lanes, values)
+
+    def LDI(self, lanes, instrs):
+        pointers = self.read(lanes, self.pc[lanes] + sext(instrs, 9))
+        values = self.read(lanes, pointers)
+        self.registers[lanes, instrs >> 9 & 0x7] = values
+        self.set_cc(lanes, values)
+
+    def LDR(self, lanes, instrs):
+        bases = self.registers[lanes, instrs >> 6 & 0x7]
+        values = self.read(lanes, bases + sext(instrs, 6))
+        self.registers[lanes, instrs >> 9 & 0x7] = values
+        self.set_cc(lanes, values)
+
+    def LEA(self, lanes, instrs):
+        values = self.pc[lanes] + sext(instrs, 9)
+        self.registers[lanes, instrs >> 9 & 0x7] = values
+        self.set_cc(lanes, values)
+
+    def NOT(self, lanes, instrs):
+        values = ~self.registers[lanes, instrs >> 6 & 0x7]
+        self.registers[lanes, instrs >> 9 & 0x7] = values
+        self.set_cc(lanes, values)
+
+    def RTI(self, lanes, instrs):
+        user = (self.psr[lanes] & 0x8000) != 0
+        self.fault(lanes[user], privilege_violation)
+        lanes = lanes[~user]
+        sp = self.registers[lanes, 6]
+        self.pc[lanes] = self.memory[lanes, sp]
+        self.psr[lanes] = self.memory[lanes, sp + np.uint16(1)]
+        self.registers[lanes, 6] = sp + np.uint16(2)
+
+    def ST(self, lanes, instrs):
+        self.write(lanes, self.pc[lanes] + sext(instrs, 9),
+                   self.registers[lanes, instrs >> 9 & 0x7])
+
+    def STI(self, lanes, instrs):
+        pointers = self.read(lanes, self.pc[lanes] + sext(instrs, 9))
+        self.write(lanes, pointers, self.registers[lanes, instrs >> 9 & 0x7])
+
+    def STR(self, lanes, instrs):
+        bases = self.registers[lanes, instrs >> 6 & 0x7]
+        self.write(lanes, bases + sext(instrs, 6),
+                   self.registers[lanes, instrs >> 9 & 0x7])
+
+    def TRAP(self, lanes, instrs):
+        self.registers[lanes, 7] = self.pc[lanes]
+        self.pc[lanes] = self.memory[lanes, instrs & 0xFF]
@@ -0,0 +1,129 @@
+import argparse
+import queue
+import struct
+import sys
+import threading
+from array import array
+from collections import deque
+
+from disassembler import Disassembler
+from objfile import from_big_endian, to_big_endian
+
+magic = b'LC3T'
+version = 1
+header = struct.Struct('>4sH')
+record_size = 4
+no_register = 8
+store = 9
+
+
+def destination(instr):
+    opcode = instr >> 12
+    if opcode in (1, 2, 5, 6, 9, 10, 14):
+        return instr >> 9 & 0x7
+    if opcode in (4, 15):
+        return 7
+    if opcode == 8:
+        return 6
+    if opcode in (3, 7, 11):
+        return store
+    return no_register
+
+
+class Tracer:
+    kinds = None
+
+    def __init__(self, capacity=1 << 16, filename=None, queue_size=16):
+        if Tracer.kinds is None:
+            Tracer.kinds = array('B', map(destination, range(1 << 16)))
+        self.ring = array('H', [0]) * (capacity * record_size)
+        self.cursor = 0
+        self.wrapped = False
+        self.stores = [0, 0]
+        self.file = None
+        self.chunks = None
+        self.writer = None
+        if filename is not None:
+            self.file = open(filename, 'wb')
+            self.file.write(header.pack(magic, version))
+            # bounded so a slow disk stalls the machine instead of
+            # buffering the whole trace in memory
+            self.chunks = queue.Queue(queue_size)
+            self.writer = threading.Thread(target=self.write_chunks)
+            self.writer.daemon = True
+            self.writer.start()
+
+    def write_chunks(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                break
+            self.file.write(to_big_endian(chunk))
+
+    def spill(self):
+        self.wrapped = True
+        if self.chunks is not None:
+            self.chunks.put(self.ring[:])
+
+    def close(self):
+        if self.chunks is None:
+            return
+        self.chunks.put(self.ring[:self.cursor])
+        self.chunks.put(None)
+        self.writer.join()
+        self.file.close()
+        self.chunks = None
+
+    def records(self):
+        if self.wrapped:
+            words = self.ring[self.cursor:] + self.ring[:self.cursor]
+        else:
+            words = self.ring[:self.cursor]
+        for i in range(0, len(words), record_size):
+            yield tuple(words[i:i + record_size])
+
+
+def read_trace(filename, chunk_records=1 << 16):
+    with open(filename, 'rb') as f:
+        file_magic, file_version = header.unpack(f.read(header.size))
+        if file_magic != magic or file_version != version:
+            raise Exception('Not an LC-3 trace file: ' + filename)
+        while True:
+            data = f.read(2 * record_size * chunk_records)
+            if not data:
+                break
+            words = from_big_endian(data)
+            for i in range(0, len(words), record_size):
+                yield tuple(words[i:i + record_size])
+
+
+def decode(records, disassembler=None):
+    disassembler = disassembler or Disassembler()
+    for pc, instr, value, address in records:
+        kind = destination(instr)
+        line = 'x{:04X}  x{:04X}  {:<20}'.format(
+            pc, instr, disassembler.disassemble_line(instr))
+        if kind < no_register:
+            line += '  R{} = x{:04X}'.format(kind, value)
+        elif kind == store:
+            line += '  [x{:04X}] = x{:04X}'.format(address, value)
+        yield line.rstrip()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Print an LC-3 execution trace as assembly.')
+    parser.add_argument('trace')
+    parser.add_argument('--tail', type=int, default=None,
+                        help='only print the last TAIL instructions')
+    args = parser.parse_args(argv)
+
+    records = read_trace(args.trace)
+    if args.tail is not None:
+        records = deque(records, maxlen=args.tail)
+    for line in decode(records):
+        sys.stdout.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
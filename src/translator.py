@@ -0,0 +1,240 @@
+class Translator:
+    max_block_size = 64
+    device_base = 0xFE00
+    pure = {'ADD', 'ADDI', 'AND', 'ANDI', 'NOT', 'LEA', 'LD', 'BR'}
+    conditions = {
+        0b001: 'v != 0 and not v & 0x8000', 0b010: 'v == 0',
+        0b011: 'not v & 0x8000', 0b100: 'v & 0x8000', 0b101: 'v != 0',
+        0b110: 'v == 0 or v & 0x8000'
+    }
+
+    def __init__(self, machine):
+        self.machine = machine
+        self.blocks = {}
+        self.extents = {}
+        self.owners = {}
+        self.entry = None
+        self.looping = False
+        self.spins = False
+        self.emitters = {
+            'ADD': self.emit_add,
+            'ADDI': self.emit_addi,
+            'AND': self.emit_and,
+            'ANDI': self.emit_andi,
+            'BR': self.emit_br,
+            'JMP': self.emit_jmp,
+            'JSR': self.emit_jsr,
+            'JSRR': self.emit_jsrr,
+            'LD': self.emit_ld,
+            'LDI': self.emit_ldi,
+            'LDR': self.emit_ldr,
+            'LEA': self.emit_lea,
+            'NOT': self.emit_not,
+            'ST': self.emit_st,
+            'STI': self.emit_sti,
+            'STR': self.emit_str,
+            'TRAP': self.emit_trap
+        }
+
+    def reset(self):
+        self.blocks.clear()
+        self.extents.clear()
+        self.owners.clear()
+
+    def invalidate(self, address):
+        for entry in self.owners.pop(address, ()):
+            del self.blocks[entry]
+            for covered in range(entry, self.extents.pop(entry)):
+                owners = self.owners.get(covered)
+                if owners is not None:
+                    owners.discard(entry)
+                    if not owners:
+                        del self.owners[covered]
+
+    def translate(self, pc):
+        machine = self.machine
+        body = []
+        cc = False
+        address = pc
+        limit = min(pc + Translator.max_block_size, Translator.device_base)
+        ends_block = False
+        self.entry = pc
+        self.looping = True
+        self.spins = False
+        while address < limit and not ends_block:
+            if machine.decoders[(machine.memory[address] >> 12) & 0xF] is None:
+                break
+            handler = machine.decoded.get(address) or machine.decode(address)
+            name = handler.func.__name__
+            emit = self.emitters.get(name)
+            if emit is None:
+                break
+            if name not in Translator.pure or name == 'LD' and \
+                    (address + 1 + handler.args[1]) & 0xFFFF >= \
+                    Translator.device_base:
+                self.looping = False
+            lines, sets_cc, ends_block = emit(address + 1, cc, *handler.args)
+            body.extend(lines)
+            cc = cc or sets_cc
+            address += 1
+        if not ends_block:
+            body.extend(self.exit(address, cc))
+            body.append('return {}'.format(address - pc))
+
+        if address == pc:
+            # pc can't start a block; remember that with a block that just
+            # interprets the instruction, so it isn't retried on every visit
+            # and is dropped like any other block once the word changes
+            self.add(pc, pc + 1, Translator.step)
+            return Translator.step
+
+        indent = '    '
+        source = 'def block(m, budget):\n' \
+            '    r = m.registers\n    mem = m.memory\n'
+        if self.spins:
+            source += '    n = 0\n    while True:\n'
+            indent += '    '
+        source += ''.join(indent + line + '\n' for line in body)
+        source = source.replace('__end__', str(address))
+        namespace = {}
+        exec(compile(source, '<block x{:04X}>'.format(pc), 'exec'), namespace)
+        block = namespace['block']
+
+        self.add(pc, address, block)
+        return block
+
+    def add(self, pc, end, block):
+        self.blocks[pc] = block
+        self.extents[pc] = end
+        for covered in range(pc, end):
+            self.owners.setdefault(covered, set()).add(pc)
+
+    @staticmethod
+    def step(m, budget):
+        pc = m.pc
+        handler = m.decoded.get(pc) or m.decode(pc)
+        m.pc = (pc + 1) & 0xFFFF
+        handler()
+        return 1
+
+    @staticmethod
+    def exit(next_pc, cc):
+        lines = ['m.set_cc(v)'] if cc else []
+        return lines + ['m.pc = {}'.format(next_pc)]
+
+    def leave(self, next_pc, cc):
+        return self.exit(next_pc, cc) + \
+            ['return {}'.format(next_pc - self.entry)]
+
+    def jump(self, next_pc, cc, target):
+        return self.exit(target, cc) + \
+            ['return {}'.format(next_pc - self.entry)], False, True
+
+    def store(self, next_pc, cc, address, sr):
+        lines = ['a = {}'.format(address),
+                 'm.write(a, r[{}])'.format(sr),
+                 'if a >= {} or {} <= a < __end__:'.format(
+                     Translator.device_base, next_pc - 1)]
+        lines += ['    ' + line for line in self.leave(next_pc, cc)]
+        return lines, False, False
+
+    @staticmethod
+    def emit_add(next_pc, cc, dr, sr1, sr2):
+        return ['v = (r[{}] + r[{}]) & 0xFFFF'.format(sr1, sr2),
+                'r[{}] = v'.format(dr)], True, False
+
+    @staticmethod
+    def emit_addi(next_pc, cc, dr, sr1, imm):
+        return ['v = (r[{}] + {}) & 0xFFFF'.format(sr1, imm & 0xFFFF),
+                'r[{}] = v'.format(dr)], True, False
+
+    @staticmethod
+    def emit_and(next_pc, cc, dr, sr1, sr2):
+        return ['v = r[{}] & r[{}]'.format(sr1, sr2),
+                'r[{}] = v'.format(dr)], True, False
+
+    @staticmethod
+    def emit_andi(next_pc, cc, dr, sr1, imm):
+        return ['v = r[{}] & {}'.format(sr1, imm & 0xFFFF),
+                'r[{}] = v'.format(dr)], True, False
+
+    def emit_br(self, next_pc, cc, nzp, pc_offset_9):
+        target = (next_pc + pc_offset_9) & 0xFFFF
+        if self.looping and cc and target == self.entry and \
+                nzp in Translator.conditions:
+            # a register-only loop back to the block entry spins in place
+            self.spins = True
+            taken = ['    ' + line for line in self.exit(target, cc)]
+            return ['n += {}'.format(next_pc - self.entry),
+                    'if {}:'.format(Translator.conditions[nzp]),
+                    '    if n < budget:',
+                    '        continue'] + taken + ['    return n'] + \
+                self.exit(next_pc, cc) + ['return n'], False, True
+        if nzp == 0b111:
+            return self.jump(next_pc, cc, target)
+        elif nzp == 0:
+            return self.jump(next_pc, cc, next_pc)
+        return self.jump(next_pc, cc, '{} if m.psr & {} else {}'.format(
+            target, nzp, next_pc))
+
+    def emit_jmp(self, next_pc, cc, base_r):
+        return self.jump(next_pc, cc, 'r[{}]'.format(base_r))
+
+    def emit_jsr(self, next_pc, cc, pc_offset_11):
+        lines, sets_cc, ends_block = self.jump(
+            next_pc, cc, (next_pc + pc_offset_11) & 0xFFFF)
+        return ['r[7] = {}'.format(next_pc)] + lines, sets_cc, ends_block
+
+    def emit_jsrr(self, next_pc, cc, base_r):
+        lines, sets_cc, ends_block = self.jump(next_pc, cc, 't')
+        return ['t = r[{}]'.format(base_r), 'r[7] = {}'.format(next_pc)] + \
+            lines, sets_cc, ends_block
+
+    @staticmethod
+    def load(address):
+        if address >= Translator.device_base:
+            return 'm.read({})'.format(address)
+        return 'mem[{}]'.format(address)
+
+    def emit_ld(self, next_pc, cc, dr, pc_offset_9):
+        return ['v = ' + self.load((next_pc + pc_offset_9) & 0xFFFF),
+                'r[{}] = v'.format(dr)], True, False
+
+    def emit_ldi(self, next_pc, cc, dr, pc_offset_9):
+        return ['a = ' + self.load((next_pc + pc_offset_9) & 0xFFFF),
+                'v = mem[a] if a < {} else m.read(a)'.format(
+                    Translator.device_base),
+                'r[{}] = v'.format(dr)], True, False
+
+    @staticmethod
+    def emit_ldr(next_pc, cc, dr, base_r, pc_offset_6):
+        return ['a = (r[{}] + {}) & 0xFFFF'.format(base_r, pc_offset_6),
+                'v = mem[a] if a < {} else m.read(a)'.format(
+                    Translator.device_base),
+                'r[{}] = v'.format(dr)], True, False
+
+    @staticmethod
+    def emit_lea(next_pc, cc, dr, pc_offset_9):
+        return ['v = {}'.format((next_pc + pc_offset_9) & 0xFFFF),
+                'r[{}] = v'.format(dr)], True, False
+
+    @staticmethod
+    def emit_not(next_pc, cc, dr, sr):
+        return ['v = r[{}] ^ 0xFFFF'.format(sr),
+                'r[{}] = v'.format(dr)], True, False
+
+    def emit_st(self, next_pc, cc, sr, pc_offset_9):
+        return self.store(next_pc, cc, (next_pc + pc_offset_9) & 0xFFFF, sr)
+
+    def emit_sti(self, next_pc, cc, sr, pc_offset_9):
+        return self.store(next_pc, cc,
+                          self.load((next_pc + pc_offset_9) & 0xFFFF), sr)
+
+    def emit_str(self, next_pc, cc, sr, base_r, pc_offset_6):
+        return self.store(next_pc, cc, '(r[{}] + {}) & 0xFFFF'.format(
+            base_r, pc_offset_6), sr)
+
+    def emit_trap(self, next_pc, cc, trap_vect_8):
+        lines, sets_cc, ends_block = self.jump(
+            next_pc, cc, 'mem[{}]'.format(trap_vect_8))
+        return ['r[7] = {}'.format(next_pc)] + lines, sets_cc, ends_block
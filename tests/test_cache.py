@@ -0,0 +1,12 @@
+from assembler import Assembler
+from cache import ImageCache
+
+program = ['.orig x3000', 'ADD R0, R0, #1', 'HALT', '.end']
+
+
+def test_lines_with_or_without_newlines(tmp_path):
+    expected = Assembler().assemble(program)
+    cache = ImageCache(str(tmp_path))
+    assert cache.assemble(program) == expected
+    assert cache.assemble([line + '\n' for line in program]) == expected
+    assert ImageCache(str(tmp_path)).assemble(program) == expected
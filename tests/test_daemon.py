@@ -0,0 +1,40 @@
+import socket
+import threading
+
+import pytest
+
+from daemon import Client, Daemon
+
+program = '\n'.join(['.orig x3000', 'AND R0, R0, #0', 'ADD R0, R0, #7',
+                     'AND R1, R1, #0', 'STI R1, MCR', 'MCR .fill xFFFE',
+                     '.end'])
+
+
+def test_existing_file_is_not_replaced(tmp_path):
+    path = tmp_path / 'lc3.sock'
+    path.write_text('keep me')
+    with pytest.raises(Exception, match='not a socket'):
+        Daemon(str(path), workers=1)
+    assert path.read_text() == 'keep me'
+
+
+def test_stale_socket_is_replaced(tmp_path):
+    path = str(tmp_path / 'lc3.sock')
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    server = Daemon(path, workers=1)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        client = Client(path)
+        try:
+            response = client.run(program)
+        finally:
+            client.close()
+    finally:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+    assert response['halt_reason'] == 'halted'
+    assert response['registers'][0] == 7
@@ -0,0 +1,63 @@
+import io
+
+import pytest
+
+from debugger import Debugger
+from lc3 import LC3
+
+engines = ['interpreter', 'translator']
+program = [
+    '.orig x3000',
+    'AND R0, R0, #0', 'AND R1, R1, #0', 'ADD R1, R1, #5',
+    'LOOP ADD R0, R0, #2', 'ADD R1, R1, #-1', 'BRp LOOP',
+    'ST R0, TOTAL', 'JSR DOUBLE', 'LD R2, TOTAL', 'HALT',
+    'DOUBLE ADD R0, R0, R0', 'RET',
+    'TOTAL .fill #0', '.end',
+]
+
+
+def booted():
+    machine = LC3(interactive=False)
+    machine.display.stream = io.StringIO()
+    machine.load(machine.assembler.assemble(program), native_traps=True)
+    return machine, Debugger(machine)
+
+
+@pytest.mark.parametrize('engine', engines)
+def test_breakpoint(engine):
+    machine, debugger = booted()
+    debugger.break_at('DOUBLE')
+    result = machine.run(engine)
+    assert (result.status, result.pc) == ('breakpoint', 0x300A)
+    assert list(machine.registers[:2]) == [10, 0]
+    assert debugger.cont(engine).status == 'halted'
+    assert list(machine.registers[:3]) == [20, 0, 10]
+
+
+@pytest.mark.parametrize('engine', engines)
+@pytest.mark.parametrize('read', [False, True])
+def test_watchpoint(engine, read):
+    machine, debugger = booted()
+    debugger.watch('TOTAL', read=read, write=not read)
+    result = machine.run(engine)
+    pc = 0x3008 if read else 0x3006
+    assert (result.status, result.pc, machine.pc) == ('watchpoint', pc, pc)
+    assert result.instructions == (22 if read else 18)
+    assert list(machine.registers[:2]) == [20 if read else 10, 0]
+    debugger.unwatch('TOTAL')
+    assert machine.run(engine).status == 'halted'
+    assert machine.registers[2] == 10
+
+
+@pytest.mark.parametrize('engine', engines)
+def test_step_over(engine):
+    machine, debugger = booted()
+    debugger.break_at(0x3007)
+    assert machine.run(engine).status == 'breakpoint'
+    result = debugger.step_over(engine)
+    assert (result.status, machine.pc) == ('breakpoint', 0x3008)
+    assert machine.registers[0] == 20
+    assert 0x3008 not in machine.breakpoints
+    result = debugger.step()
+    assert (result.status, result.instructions, machine.pc) == \
+        ('budget', 1, 0x3009)
@@ -0,0 +1,108 @@
+import io
+import os
+import random
+from array import array
+
+import pytest
+
+from assembler import Assembler
+from disassembler import Disassembler
+from lc3 import LC3, ExecutionResult
+
+res_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                       'res')
+
+
+def read_source(*names):
+    lines = []
+    for name in names:
+        with open(os.path.join(res_dir, *name.split('/'))) as f:
+            lines.extend(f.readlines())
+    return lines
+
+
+def execute(memory, engine, inputs='', max_instructions=None,
+            registers=None):
+    machine = LC3(interactive=False)
+    machine.display.stream = io.StringIO()
+    machine.keyboard.feed(inputs)
+    machine.load(memory[:])
+    if registers is not None:
+        machine.registers[:] = array('H', registers)
+    result = machine.run(engine, max_instructions)
+    machine.display.flush()
+    return (result.status, result.instructions, result.pc,
+            list(machine.registers), machine.psr, machine.memory.tobytes(),
+            machine.display.stream.getvalue())
+
+
+def assert_equivalent(memory, max_instructions=None, **kwargs):
+    # blocks run to their end, so the translator may overshoot a budget;
+    # the interpreter is held to the count the translator reached instead
+    actual = execute(memory, 'translator', max_instructions=max_instructions,
+                     **kwargs)
+    if actual[0] == ExecutionResult.budget:
+        max_instructions = actual[1]
+    expected = execute(memory, 'interpreter',
+                       max_instructions=max_instructions, **kwargs)
+    assert actual == expected
+    return actual
+
+
+@pytest.mark.parametrize('names', [
+    ['io_test.asm'],
+    ['bench/os.asm', 'bench/arith.asm'],
+    ['bench/os.asm', 'bench/sort.asm'],
+    ['bench/os.asm', 'bench/fib.asm'],
+    ['bench/os.asm', 'bench/puts.asm'],
+])
+def test_sample_programs(names):
+    memory = Assembler().assemble(read_source(*names))
+    assert assert_equivalent(memory, inputs='q')[0] == 'halted'
+
+
+def test_branch_over_data_word():
+    memory = Assembler().assemble([
+        '.orig x3000', 'BR MAIN', '.fill xD000', 'MAIN ADD R0, R0, #1',
+        'ADD R0, R0, #1', 'HALT_NOW AND R1, R1, #0', 'STI R1, MCR',
+        'MCR .fill xFFFE', '.end'])
+    status, instructions = assert_equivalent(memory)[:2]
+    assert (status, instructions) == ('halted', 5)
+
+
+def test_budget_in_spinning_block():
+    memory = Assembler().assemble([
+        '.orig x3000', 'LD R2, N', 'AND R3, R3, #0', 'LOOP ADD R3, R3, #1',
+        'ADD R2, R2, #-1', 'BRp LOOP', 'AND R1, R1, #0', 'STI R1, MCR',
+        'N .fill #10000', 'MCR .fill xFFFE', '.end'])
+    for budget in [1, 2, 3, 1000, 29999]:
+        assert_equivalent(memory, max_instructions=budget)
+    machine = LC3(interactive=False)
+    machine.load(memory[:])
+    while machine.run('translator', 4097).status == 'budget':
+        pass
+    assert machine.registers[3] == 10000
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_random_programs(seed):
+    rng = random.Random(seed)
+    memory = array('H', [0]) * LC3.mem_size
+    for address in range(0x3000, 0x3100):
+        memory[address] = rng.randrange(1 << 16)
+    registers = [rng.choice([0, 1, 0x3000 + rng.randrange(0x100),
+                             rng.randrange(1 << 16)]) for _ in range(8)]
+    assert_equivalent(memory, registers=registers, max_instructions=2000)
+
+
+def test_most_negative_offsets():
+    source = ['.orig x3000', 'AND R0, R0, #0', 'ADD R0, R0, #-16',
+              '.fill xE300', '.fill x6460', 'AND R3, R3, #-16',
+              'AND R4, R4, #0', 'STI R4, MCR', 'MCR .fill xFFFE', '.end']
+    memory = Assembler().assemble(source)  # LEA R1, #-256; LDR R2, R1, #-32
+    registers = assert_equivalent(memory)[3]
+    assert registers[0] == 0xFFF0
+    assert registers[1] == 0x3003 - 256
+    lines = Disassembler().disassemble(memory[0x3000:0x3005])
+    assert lines[1:4] == ['ADD R0, R0, #-16', 'LEA R1, #-256',
+                          'LDR R2, R1, #-32']
@@ -0,0 +1,44 @@
+from assembler import Assembler
+from incremental import IncrementalAssembler
+
+main = ['.orig x3000', 'LD R0, VALUE', 'JSR SUB', 'HALT',
+        'VALUE .fill #7', '.end']
+sub = ['.orig x3100', 'SUB ADD R0, R0, #1', 'RET', '.end']
+data = ['.orig x4000', '.stringz "hi"', '.end']
+
+
+def check(incremental, lines):
+    diff = incremental.update(lines)
+    assert incremental.memory == Assembler().assemble(lines)
+    return diff
+
+
+def test_first_update_is_the_whole_image():
+    incremental = IncrementalAssembler()
+    diff = check(incremental, main + sub)
+    memory = Assembler().assemble(main + sub)
+    assert diff == {address: word for address, word in enumerate(memory)
+                    if word}
+
+
+def test_edit_changes_only_the_edited_word():
+    incremental = IncrementalAssembler()
+    check(incremental, main + sub + data)
+    edited = sub[:1] + ['SUB ADD R0, R0, #2'] + sub[2:]
+    assert check(incremental, main + edited + data) == {0x3100: 0x1022}
+
+
+def test_moved_label_relinks_its_references():
+    incremental = IncrementalAssembler()
+    check(incremental, main + sub)
+    moved = sub[:1] + ['AND R1, R1, #0'] + sub[1:]
+    diff = check(incremental, main + moved)
+    # SUB moves down a word: the JSR that calls it and the shifted code
+    assert diff == {0x3001: 0x48FF, 0x3100: 0x5260,
+                    0x3101: 0x1021, 0x3102: 0xC1C0}
+
+
+def test_deleted_segment_is_cleared():
+    incremental = IncrementalAssembler()
+    check(incremental, main + sub + data)
+    assert check(incremental, main + sub) == {0x4000: 0, 0x4001: 0}
@@ -0,0 +1,39 @@
+import pytest
+
+from assembler import Assembler
+from lc3 import LC3
+from simd import VectorLC3
+
+program = [
+    '.orig x0180', '.fill ISR', '.end',
+    '.orig x1000',
+    'ISR LDI R2, KBDR', 'AND R1, R1, #0', 'STI R1, MCR', 'RTI',
+    'KBDR .fill xFE02', 'MCR .fill xFFFE', '.end',
+    '.orig x3000',
+    'LD R0, IE', 'STI R0, KBSR', 'AND R3, R3, #0',
+    'LOOP ADD R3, R3, #1', 'BR LOOP',
+    'IE .fill x4000', 'KBSR .fill xFE00', '.end',
+]
+
+
+@pytest.mark.parametrize('engine', ['interpreter', 'translator'])
+def test_interrupt_follows_enable(engine):
+    machine = LC3(interactive=False)
+    machine.keyboard.feed('k')
+    machine.load(Assembler().assemble(program))
+    result = machine.run(engine, 1 << 20)
+    assert result.status == 'halted'
+    assert result.instructions < 10
+    assert machine.registers[2] == ord('k')
+    # taken from user mode: pushed on the supervisor stack, R6 kept aside
+    assert machine.registers[6] == LC3.initial_ssp - 2
+    assert machine.usp == 0
+    assert machine.memory[LC3.initial_ssp - 1] == 0x8001
+
+
+def test_vector_lanes_store_interrupt_enable():
+    machine = VectorLC3(2)
+    machine.load(Assembler().assemble(program))
+    results = machine.run(100)
+    assert [result.status for result in results] == ['budget', 'budget']
+    assert (machine.memory[:, LC3.kbsr] == LC3.interrupt_enable).all()
@@ -0,0 +1,67 @@
+import pytest
+
+from linker import LinkerException, link_files, main
+from objfile import read_object
+
+main_source = ['.orig x3000', 'LD R0, COUNT', 'JSR TWICE', 'HALT',
+               '.end']
+lib_source = ['.orig x4000', '.export TWICE', '.export COUNT',
+              'TWICE ADD R0, R0, R0', 'RET', 'COUNT .fill #21', 'TABLE',
+              '.fill TWICE', '.end']
+
+
+def write_sources(tmp_path, **sources):
+    paths = {}
+    for name, lines in sources.items():
+        path = tmp_path / (name + '.asm')
+        path.write_text('\n'.join(lines) + '\n')
+        paths[name] = str(path)
+    return paths
+
+
+def test_placed_module_is_relocated(tmp_path):
+    paths = write_sources(tmp_path, main=main_source, lib=lib_source)
+    output = str(tmp_path / 'linked.obj')
+    assert main([paths['main'], paths['lib'], '--place',
+                 paths['lib'] + '=x3010', '-o', output, '-j', '1']) == 0
+    memory, segments, symbols = read_object(output)
+    assert symbols == {'TWICE': 0x3010, 'COUNT': 0x3012}
+    assert segments == [(0x3000, 0x3003), (0x3010, 0x3014)]
+    assert memory[0x3000] == 0x2000 | 0x11  # LD R0, COUNT
+    assert memory[0x3001] == 0x4800 | 0x0E  # JSR TWICE
+    assert memory[0x3013] == 0x3010  # .fill TWICE
+    assert memory[0x3010:0x3013].tolist() == [0x1000, 0xC1C0, 21]
+
+
+def test_overlapping_modules(tmp_path):
+    paths = write_sources(tmp_path, main=main_source, lib=lib_source)
+    with pytest.raises(LinkerException, match='overlaps'):
+        link_files([paths['main'], paths['lib']], workers=1,
+                   placements={paths['lib']: 0x3002})
+
+
+def test_undefined_symbols(tmp_path):
+    paths = write_sources(tmp_path, main=main_source)
+    with pytest.raises(LinkerException,
+                       match='Undefined symbols: COUNT, TWICE'):
+        link_files([paths['main']], workers=1)
+
+
+def test_build_dir_keeps_same_named_sources_apart(tmp_path):
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'b').mkdir()
+    first = write_sources(tmp_path / 'a', os=main_source)['os']
+    second = write_sources(tmp_path / 'b', os=lib_source)['os']
+    build_dir = str(tmp_path / 'build')
+    for _ in range(2):  # the second link reads the cached modules
+        linker = link_files([first, second], build_dir, workers=1,
+                            placements={second: 0x3010})
+        assert linker.symbols == {'TWICE': 0x3010, 'COUNT': 0x3012}
+        assert linker.memory[0x3001] == 0x4800 | 0x0E  # JSR TWICE
+
+
+def test_symbol_exported_twice(tmp_path):
+    paths = write_sources(tmp_path, lib=lib_source, copy=[
+        '.orig x5000', '.export COUNT', 'COUNT .fill #1', '.end'])
+    with pytest.raises(LinkerException, match='COUNT is exported by both'):
+        link_files([paths['lib'], paths['copy']], workers=1)
@@ -0,0 +1,28 @@
+import os
+import random
+from array import array
+
+import pytest
+
+from assembler import Assembler
+from listing import ImageDisassembler
+
+res_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                       'res')
+
+
+@pytest.mark.parametrize('name', ['io_test.asm', 'bench/os.asm'])
+def test_listing_reassembles_with_symbols(name):
+    assembler = Assembler()
+    memory = assembler.assemble_file(os.path.join(res_dir, name))
+    lines = ImageDisassembler(memory, assembler.labels).disassemble()
+    assert Assembler().assemble(lines) == memory
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_random_image_reassembles(seed):
+    # random words include PC offsets that would wrap around memory
+    rng = random.Random(seed)
+    memory = array('H', [rng.randrange(1 << 16) for _ in range(1 << 16)])
+    lines = ImageDisassembler(memory).disassemble()
+    assert Assembler().assemble(lines) == memory
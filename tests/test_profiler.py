@@ -0,0 +1,29 @@
+import io
+
+from lc3 import LC3
+from profiler import Profile
+
+program = [
+    '.orig x3000',
+    'AND R1, R1, #0', 'ADD R1, R1, #3', 'LEA R2, TWICE',
+    'LOOP JSR ONCE', 'JSRR R2', 'ADD R1, R1, #-1', 'BRp LOOP',
+    'HALT',
+    'ONCE RET', 'TWICE RET', '.end',
+]
+
+
+def test_profile_counts_branches_and_calls():
+    machine = LC3(interactive=False)
+    machine.display.stream = io.StringIO()
+    machine.load(machine.assembler.assemble(program), native_traps=True)
+    snapshot = machine.snapshot()
+    profile = Profile()
+    result = machine.run('interpreter', profile=profile)
+    assert (result.status, result.instructions) == ('halted', 22)
+    assert profile.branches() == [(0x3006, 2, 1)]
+    assert profile.subroutines() == {0x3008: 3, 0x3009: 3}
+    assert profile.loops() == [(0x3003, 0x3006, 2, 12)]
+    # an unprofiled run afterwards no longer counts into the profile
+    machine.restore(snapshot)
+    assert machine.run('interpreter').status == 'halted'
+    assert profile.subroutines() == {0x3008: 3, 0x3009: 3}
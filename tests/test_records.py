@@ -0,0 +1,43 @@
+from array import array
+
+from assembler import Assembler
+from objfile import iter_object, read_object
+
+source = [
+    '.orig x3000', 'LEA R0, TEXT', 'PUTS', 'LD R1, LATER', 'BRnzp SKIP',
+    'TEXT .stringz "records"', 'SKIP HALT', '.blkw 3', 'LATER .fill END',
+    '.end',
+    '.orig x4000', 'TABLE .fill TEXT', '.fill SKIP', '.blkw #5000',
+    'END .fill TABLE', '.end',
+    # longer than the chunks objfile reads and writes
+    '.orig x6000'] + ['.fill #{}'.format(i) for i in range(5000)] + ['.end']
+
+
+def test_records_match_assembly():
+    expected = Assembler().assemble(source)
+    assembler = Assembler()
+    memory = array('H', [0]) * (1 << 16)
+    addresses = []
+    for address, word in assembler.assemble_records(source):
+        memory[address] = word
+        addresses.append(address)
+    assert memory == expected
+    assert addresses == sorted(set(addresses))
+    assert assembler.labels['END'] == 0x4000 + 2 + 5000
+
+
+def test_write_records_round_trip(tmp_path):
+    reference = Assembler()
+    expected = reference.assemble(source)
+    filename = str(tmp_path / 'program.obj')
+    Assembler().write_records(source, filename)
+    memory, segments, symbols = read_object(filename)
+    assert memory == expected
+    assert symbols == reference.labels
+    records = list(iter_object(filename))
+    assert records == [(address, expected[address])
+                       for start, end in segments
+                       for address in range(start, end)]
+    covered = {address for address, _ in records}
+    assert all(expected[address] == 0 for address in range(1 << 16)
+               if address not in covered)
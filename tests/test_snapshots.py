@@ -0,0 +1,21 @@
+import io
+
+from assembler import Assembler
+from lc3 import LC3
+
+program = ['.orig x3000', 'LEA R0, TEXT', 'PUTS', 'HALT',
+           'TEXT .stringz "forked"', '.end']
+
+
+def test_fork_keeps_run_configuration():
+    machine = LC3(interactive=False)
+    machine.display.stream = io.StringIO()
+    machine.blocking_input = False
+    machine.load(Assembler().assemble(program), native_traps=True)
+    child = machine.fork()
+    assert child.native_traps and not child.blocking_input
+    result = child.run()
+    child.display.flush()
+    assert (result.status, result.instructions) == ('halted', 3)
+    assert machine.display.stream.getvalue() == 'forked'
+    assert machine.pc == 0x3000
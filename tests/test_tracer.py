@@ -0,0 +1,48 @@
+import io
+
+import pytest
+
+from lc3 import LC3
+from tracer import Tracer, destination, no_register, read_trace, store
+
+program = [
+    '.orig x3000', 'LD R1, COUNT',
+    'LOOP ST R1, SAVED', 'ADD R1, R1, #-1', 'BRp LOOP', 'HALT',
+    'COUNT .fill #50', 'SAVED .fill #0', '.end',
+]
+
+
+def booted():
+    machine = LC3(interactive=False)
+    machine.display.stream = io.StringIO()
+    machine.load(machine.assembler.assemble(program), native_traps=True)
+    return machine
+
+
+def test_trace_file_records(tmp_path):
+    # a small ring, so records are written over earlier laps many times
+    filename = str(tmp_path / 'run.trace')
+    machine = booted()
+    tracer = Tracer(capacity=16, filename=filename)
+    try:
+        result = machine.run(trace=tracer)
+    finally:
+        tracer.close()
+    records = list(read_trace(filename))
+    assert len(records) == result.instructions == 152
+    for pc, instr, value, address in records:
+        kind = destination(instr)
+        if kind == store:
+            assert address == 0x3006
+        elif kind == no_register:
+            assert (value, address) == (0, 0)
+        else:
+            assert address == 0
+    assert records[-4][1:] == (0x3204, 1, 0x3006)  # ST R1, SAVED
+
+
+def test_profile_and_trace_together():
+    machine = booted()
+    with pytest.raises(Exception, match='profiled or traced'):
+        machine.exec_memory(machine.memory, native_traps=True, profile=True,
+                            trace=Tracer(), max_instructions=1000)